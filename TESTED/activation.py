@@ -0,0 +1,59 @@
+"""
+RF_INTF_ACTIVATED_NTF decoding shared by the scanners
+
+Mirrors the TECH_PARAMS table of TagInfo_t.parse() in
+doorman2/esp32/lib_PN7150.py: the tag identifier is found from the
+technology byte and the length fields of the frame, not a fixed offset.
+"""
+
+# RF_INTF_ACTIVATED_NTF layout (offsets into the whole frame)
+ACT_MODE_TECH = 6    # Activation RF Technology and Mode
+ACT_PARAMS_LEN = 9   # Length of RF Technology Specific Parameters
+ACT_PARAMS = 10      # RF Technology Specific Parameters start here
+
+# Activation RF Technology and Mode, poll side
+TECH_NFCA = 0x00
+TECH_NFCB = 0x01
+TECH_NFCF = 0x02
+TECH_15693 = 0x06
+
+# Where the identifier sits in the technology specific parameters:
+# (bytes skipped first, field size or 0 if a length byte comes first,
+# identifier bytes at the start of the field or 0 for all of it)
+UID_FIELDS = {
+    TECH_NFCA: (2, 0, 0),    # SENS_RES, then NFCID1 (4, 7 or 10 bytes)
+    TECH_NFCB: (0, 0, 4),    # SENSB_RES, led by NFCID0
+    TECH_NFCF: (1, 0, 8),    # bit rate, then SENSF_RES, led by NFCID2
+    TECH_15693: (2, 8, 0),   # flags and DSFID, then the UID
+}
+
+def extract_uid(response, length):
+    """
+    Return the identifier of the tag activated by an RF_INTF_ACTIVATED_NTF.
+
+    Args:
+        response (bytearray): The whole notification, header included
+        length (int): Valid bytes in response
+
+    Returns:
+        bytes or None: NFCID1, NFCID0, NFCID2 or ISO15693 UID; None if the
+            frame is not an activation, is truncated or its technology
+            has no identifier here
+    """
+    if length <= ACT_PARAMS or response[0] != 0x61 or response[1] != 0x05:
+        return None
+    end = ACT_PARAMS + response[ACT_PARAMS_LEN]
+    field = UID_FIELDS.get(response[ACT_MODE_TECH])
+    if field is None or end > length:
+        return None
+
+    skip, size, take = field
+    i = ACT_PARAMS + skip
+    if not size:
+        if i >= end:
+            return None
+        size = response[i]
+        i += 1
+    if i + size > end or size < take:
+        return None
+    return bytes(response[i:i + (take or size)])
@@ -9,44 +9,12 @@ import time
 
 # Import the MicroPython PN7150 library
 exec(open('lib_PN7150.py').read())
+from activation import extract_uid
 
 def print_hex_array(data, length):
     """Convert byte array to hex string"""
     return ' '.join([f'0x{byte:02X}' for byte in data[:length]])
 
-def extract_correct_uid(response, length):
-    """Extract UID from correct position in RF_INTF_ACTIVATED_NTF response"""
-    if length < 17:  # Need at least 17 bytes for UID
-        return None
-    
-    print(f"  Full response: {print_hex_array(response, length)}")
-    
-    # Analyze response structure to find UID position
-    # For MIFARE: UID is at positions 13-16 (4 bytes)
-    # For NTAG: UID might be at different position due to longer response
-    
-    # Analyze the response structure
-    if length >= 20:
-        # Look for the UID length pattern
-        if response[11] == 0x04 and response[12] == 0x00 and response[13] == 0x04:
-            # MIFARE pattern: 0x04 0x00 0x04 [UID]
-            uid_start = 14
-            uid_length = 4
-        elif response[12] == 0x07 and response[13] == 0x04:
-            # NTAG pattern: 0x07 0x04 [UID]
-            uid_start = 13
-            uid_length = 7
-        else:
-            # Fallback to position 13
-            uid_start = 13
-            uid_length = 4
-    
-    if length >= uid_start + uid_length:
-        uid = response[uid_start:uid_start + uid_length]
-        return uid
-    
-    return None
-
 def send_select_aid(nfc, aid):
     """Send SELECT APDU command to check for HCE app"""
     # SELECT APDU: CLA=00, INS=A4, P1=04, P2=00, Lc=length, AID=variable
@@ -125,7 +93,8 @@ def main():
                 # Check if it's NFC-A technology (MIFARE, NTAG, etc.)
                 if RfInterface.ModeTech == (MODE_POLL | TECH_PASSIVE_NFCA):
                     # Extract UID from raw response
-                    uid = extract_correct_uid(nfc.rxBuffer, nfc.rxMessageLength)
+                    print(f"  Full response: {print_hex_array(nfc.rxBuffer, nfc.rxMessageLength)}")
+                    uid = extract_uid(nfc.rxBuffer, nfc.rxMessageLength)
                     if uid:
                         uid_str = ":".join([f"{b:02X}" for b in uid])
                         print(f"Card UID: {uid_str}")
@@ -0,0 +1,330 @@
+"""
+Doorman2 Event Queue Module for ESP32
+Bounded FIFO of MQTT events waiting to be published, backed by an
+on-flash journal so events survive reboots and long network outages
+"""
+
+import os
+
+# Overflow policies
+DROP_OLDEST = 'drop_oldest'  # make room by discarding the oldest event
+DROP_NEWEST = 'drop_newest'  # keep the backlog, discard the incoming event
+COALESCE = 'coalesce'        # drop exact duplicates first, then the oldest event
+
+# Sequence numbers are reserved on flash this many at a time, before they
+# are handed out, so a reboot never reuses one that may have been published
+SEQ_RESERVE = 32
+
+
+class EventQueue:
+    """
+    Fixed-capacity ring buffer of (name, payload, seq) events.
+
+    Events come out in the order they went in. Memory use is bounded by
+    `capacity` no matter how long the broker is unreachable; what happens
+    to events that do not fit is decided by the overflow policy, and the
+    number of discarded events is kept in `dropped`.
+
+    Producers (handle_auth, the sync task) and the consumer (the MQTT
+    task) all run on the same asyncio loop, so no locking is needed.
+    """
+
+    def __init__(self, capacity=64, policy=DROP_OLDEST):
+        """
+        Initialize an empty queue.
+
+        Args:
+            capacity (int): Maximum number of queued events
+            policy (str): DROP_OLDEST, DROP_NEWEST or COALESCE
+        """
+        if policy not in (DROP_OLDEST, DROP_NEWEST, COALESCE):
+            raise ValueError("unknown overflow policy: %s" % policy)
+        self._names = [None] * capacity
+        self._payloads = [None] * capacity
+        self._seqs = [0] * capacity
+        self._capacity = capacity
+        self._policy = policy
+        self._head = 0
+        self._len = 0
+        self.dropped = 0
+
+    def put(self, name, payload, seq=0):
+        """
+        Append an event, applying the overflow policy if the queue is full.
+
+        Args:
+            name (str): Event name (topic suffix)
+            payload (bytes): Event payload
+            seq (int): Journal sequence number of the event
+
+        Returns:
+            bool: True if the event was queued, False if it was dropped
+        """
+        if self._len == self._capacity:
+            self.dropped += 1
+            if self._policy == DROP_NEWEST:
+                return False
+            # duplicates are only traded away once there is no room
+            if self._policy == COALESCE and self._find(name, payload) >= 0:
+                return False
+            self._drop_head()
+        i = (self._head + self._len) % self._capacity
+        self._names[i] = name
+        self._payloads[i] = payload
+        self._seqs[i] = seq
+        self._len += 1
+        return True
+
+    def peek(self):
+        """
+        Return the oldest event without removing it.
+
+        Returns:
+            tuple or None: (name, payload, seq), or None if the queue is empty
+        """
+        if not self._len:
+            return None
+        i = self._head
+        return self._names[i], self._payloads[i], self._seqs[i]
+
+    def pop(self, event):
+        """
+        Remove an event returned by peek(), typically once it is published.
+
+        Does nothing if the overflow policy already discarded that event
+        in the meantime, so a newer event is never lost by mistake.
+
+        Args:
+            event (tuple): The tuple returned by peek()
+        """
+        if self._len and self._payloads[self._head] is event[1]:
+            self._drop_head()
+
+    def _drop_head(self):
+        self._names[self._head] = None
+        self._payloads[self._head] = None
+        self._head = (self._head + 1) % self._capacity
+        self._len -= 1
+
+    def _find(self, name, payload):
+        for n in range(self._len):
+            i = (self._head + n) % self._capacity
+            if self._names[i] == name and self._payloads[i] == payload:
+                return i
+        return -1
+
+    def __len__(self):
+        return self._len
+
+
+class EventJournal:
+    """
+    Append-only, size-capped on-flash log of events with sequence numbers.
+
+    Every event gets a monotonically increasing sequence number. Records
+    are only buffered in RAM by append(), which is safe to call on the
+    unlock path; flush() writes everything buffered in a single append
+    and is called periodically from the network loop.
+
+    The log is split over two segment files of about `segment_size` bytes.
+    When the active segment is full the other one is truncated and becomes
+    active, so flash use stays bounded and writes rotate between two files
+    instead of rewriting one. Published events are acknowledged with ack();
+    the highest acknowledged sequence number is logged as well, so after a
+    reboot unacknowledged events can be replayed. A segment still holding
+    unacknowledged events is only discarded once the active one has grown
+    to twice its size.
+
+    Events are published before the periodic flush, so sequence numbers
+    are reserved SEQ_RESERVE at a time with a record written right away;
+    after a reboot numbering resumes above the reservation and the numbers
+    lost with the RAM buffer are skipped, never reused.
+
+    Record format, one per line: b'E <seq> <name> <payload>' for events,
+    b'A <seq>' for acknowledgements and b'R <seq>' for the highest
+    reserved sequence number. Payloads must not contain newlines.
+    """
+
+    def __init__(self, path='journal', segment_size=8 * 1024, max_pending=64):
+        """
+        Initialize the journal and recover its state from flash.
+
+        Args:
+            path (str): Segment file prefix; files are path.0 and path.1
+            segment_size (int): Size at which the active segment rotates
+            max_pending (int): Unflushed records kept before the oldest
+                are discarded (only reached if flushing keeps failing)
+        """
+        self._paths = (path + '.0', path + '.1')
+        self._segment_size = segment_size
+        self._max_pending = max_pending
+        self._pending = []
+        self._pending_event = 0  # highest event seq in _pending
+        self.seq = 0
+        self.acked = 0
+        self._flushed_ack = 0
+        self._reserved = 0
+        self._active = 0
+        self._size = 0
+        self._last_event = [0, 0]  # highest event seq per segment
+
+        last = [0, 0]
+        for n in range(2):
+            for seq, name, payload in self._read(n):
+                if name is not None:
+                    self._last_event[n] = max(self._last_event[n], seq)
+                elif payload is None:
+                    self.acked = max(self.acked, seq)
+                else:
+                    self._reserved = max(self._reserved, seq)
+                self.seq = max(self.seq, seq)
+                last[n] = max(last[n], seq)
+        self._active = 0 if last[0] >= last[1] else 1
+        self._flushed_ack = self.acked
+        try:
+            self._size = os.stat(self._paths[self._active])[6]
+        except OSError:
+            self._size = 0
+        print(f"journal: seq {self.seq}, acked {self.acked}")
+        self._reserve()
+
+    def append(self, name, payload):
+        """
+        Assign a sequence number to an event and buffer it for flushing.
+
+        Args:
+            name (str): Event name
+            payload (bytes): Event payload
+
+        Returns:
+            int: Sequence number of the event
+        """
+        if self.seq >= self._reserved:
+            self._reserve()
+        self.seq += 1
+        if len(self._pending) >= self._max_pending:
+            self._pending.pop(0)
+        self._pending.append(b'E %d %s %s\n' % (self.seq, name.encode(), payload))
+        self._pending_event = self.seq
+        return self.seq
+
+    def _reserve(self):
+        # written at once, with whatever else is buffered
+        self._reserved = self.seq + SEQ_RESERVE
+        self._pending.append(b'R %d\n' % self._reserved)
+        self.flush()
+
+    def ack(self, seq):
+        """
+        Mark all events up to and including seq as delivered.
+
+        Args:
+            seq (int): Sequence number of the last published event
+        """
+        if seq > self.acked:
+            self.acked = seq
+
+    def flush(self):
+        """
+        Write buffered records and the current acknowledgement to flash.
+
+        Returns:
+            int: Number of bytes written
+        """
+        records = self._pending
+        self._pending = []
+        last_event = self._pending_event
+        self._pending_event = 0
+        acked = self.acked
+        if not records and acked == self._flushed_ack:
+            return 0
+
+        data = b''.join(records)
+        if acked != self._flushed_ack:
+            data += b'A %d\n' % acked
+        active = self._active
+        mode = 'ab'
+        size = self._size + len(data)
+        if size > self._segment_size and (self._last_event[active ^ 1] <= acked or
+                                          size > 2 * self._segment_size):
+            # rotate: the older segment is discarded, carry ack and reservation over
+            if self._last_event[active ^ 1] > acked:
+                print(f"journal: discarding unacked events {acked + 1} to {self._last_event[active ^ 1]}")
+            active ^= 1
+            data = b'A %d\nR %d\n' % (acked, self._reserved) + data
+            mode = 'wb'
+        try:
+            with open(self._paths[active], mode) as f:
+                f.write(data)
+        except OSError as e:
+            print(f"journal: flush failed: {e}")
+            self._pending = (records + self._pending)[-self._max_pending:]
+            self._pending_event = max(self._pending_event, last_event)
+            return 0
+        if mode == 'wb':
+            self._active = active
+            self._size = 0
+            self._last_event[active] = 0
+        self._last_event[active] = max(self._last_event[active], last_event)
+        self._size += len(data)
+        self._flushed_ack = acked
+        return len(data)
+
+    def unacked(self, before=None, limit=8):
+        """
+        Read journalled events that were not acknowledged yet.
+
+        Args:
+            before (int, optional): Only return events with a lower seq
+            limit (int): Maximum number of events to return
+
+        Returns:
+            list: (name, payload, seq) tuples, oldest first
+        """
+        events = []
+        acked = self.acked
+        for records in (self._read(self._active ^ 1), self._read(self._active),
+                        (_parse(line) for line in self._pending)):
+            for seq, name, payload in records:
+                if name is None or seq <= acked:
+                    continue
+                if before is not None and seq >= before:
+                    return events
+                events.append((name, payload, seq))
+                if len(events) >= limit:
+                    return events
+        return events
+
+    def _read(self, n):
+        try:
+            f = open(self._paths[n], 'rb')
+        except OSError:
+            return
+        with f:
+            for line in f:
+                record = _parse(line)
+                if record is not None:
+                    yield record
+
+
+def _parse(line):
+    """
+    Parse a journal line into (seq, name, payload).
+
+    name is None for acknowledgements and reservations; payload is None
+    for acknowledgements and b'R' for reservations.
+    """
+    if not line.endswith(b'\n'):
+        # torn write after a power loss
+        return None
+    parts = line[:-1].split(b' ', 3)
+    try:
+        if parts[0] == b'E' and len(parts) == 4:
+            return int(parts[1]), parts[2].decode(), parts[3]
+        if parts[0] == b'A' and len(parts) == 2:
+            return int(parts[1]), None, None
+        if parts[0] == b'R' and len(parts) == 2:
+            return int(parts[1]), None, b'R'
+    except ValueError:
+        pass
+    return None
@@ -0,0 +1,532 @@
+"""
+Doorman2 Hash Database Module for ESP32
+Compact sorted table of authorised card/PIN hashes used by handle_auth
+
+On-device file format (all integers little endian):
+
+    offset  size  field
+    0       4     magic b'DM2H'
+    4       2     format version (FORMAT_VERSION)
+    6       2     reserved, must be 0
+    8       4     database version (bumped by the server on every change)
+    12      4     entry count N
+    16      32*N  raw SHA-256 digests, sorted ascending, no duplicates
+
+The legacy text format (one hex digest per line) is still accepted and
+converted to the binary format when it is loaded or installed.
+
+Incremental sync uses a delta file with the same layout conventions:
+
+    offset  size  field
+    0       4     magic b'DM2D'
+    4       2     format version (FORMAT_VERSION)
+    6       2     reserved, must be 0
+    8       4     base version the delta applies to
+    12      4     resulting database version
+    16      4     number of added digests A
+    20      4     number of removed digests R
+    24      32*A  added digests
+    24+32*A 32*R  removed digests
+
+Removals are applied before additions.
+"""
+
+import asyncio
+import binascii
+import os
+import struct
+
+HASHES_FILE = 'hashes'
+DIGEST_SIZE = 32  # SHA-256
+
+MAGIC = b'DM2H'
+FORMAT_VERSION = 1
+HEADER_FORMAT = '<4sHHII'
+HEADER_SIZE = 16
+
+DELTA_MAGIC = b'DM2D'
+DELTA_HEADER_FORMAT = '<4sHHIIII'
+DELTA_HEADER_SIZE = 24
+
+# Tables up to this size are kept in RAM, bigger ones are searched on flash
+RAM_TABLE_LIMIT = 48 * 1024
+
+# Bloom prefilter sizing: ~1% false positives at 10 bits per entry
+BLOOM_BITS_PER_ENTRY = 10
+BLOOM_MIN_BYTES = 128
+BLOOM_MAX_BYTES = 16 * 1024
+
+# Async loads and merges let other tasks run after this many entries
+YIELD_EVERY = 512
+
+
+def pack(digests, version=0):
+    """
+    Build a binary hashes file from raw digests.
+
+    Args:
+        digests (iterable): Raw 32-byte SHA-256 digests, in any order
+        version (int): Database version to store in the header
+
+    Returns:
+        bytes: Complete file contents (header followed by sorted table)
+    """
+    table = sorted(set(bytes(d) for d in digests))
+    for d in table:
+        if len(d) != DIGEST_SIZE:
+            raise ValueError("digest must be %d bytes" % DIGEST_SIZE)
+    header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, 0, version, len(table))
+    return header + b''.join(table)
+
+
+def pack_delta(base, version, added, removed):
+    """
+    Build a delta file turning database `base` into database `version`.
+
+    Args:
+        base (int): Version the delta applies to
+        version (int): Resulting database version
+        added (iterable): Raw digests to add
+        removed (iterable): Raw digests to remove
+
+    Returns:
+        bytes: Complete delta file contents
+    """
+    added = sorted(set(bytes(d) for d in added))
+    removed = sorted(set(bytes(d) for d in removed))
+    header = struct.pack(DELTA_HEADER_FORMAT, DELTA_MAGIC, FORMAT_VERSION, 0,
+                         base, version, len(added), len(removed))
+    return header + b''.join(added) + b''.join(removed)
+
+
+def parse_text(lines, strict=False):
+    """
+    Parse the legacy text format into raw digests.
+
+    Args:
+        lines (iterable): Lines containing one hex digest each
+        strict (bool): Reject malformed lines instead of skipping them
+
+    Returns:
+        list: Raw 32-byte digests; blank lines are skipped, and so are
+        malformed ones unless strict is set
+
+    Raises:
+        ValueError: If strict is set and a line is not a hex digest
+    """
+    digests = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if len(line) != 2 * DIGEST_SIZE:
+                raise ValueError("bad length")
+            digests.append(binascii.unhexlify(line))
+        except ValueError:
+            if strict:
+                raise ValueError("malformed hashes entry: %s" % line[:80])
+            print(f"hashdb: skipping malformed entry: {line}")
+    return digests
+
+
+def _read_header(f):
+    """Return (version, count) of an open binary hashes file, or None if it is text."""
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:4] != MAGIC:
+        return None
+    magic, fmt, _, version, count = struct.unpack(HEADER_FORMAT, header)
+    if fmt != FORMAT_VERSION:
+        raise ValueError("unsupported hashes format %d" % fmt)
+    return version, count
+
+
+def _run(steps):
+    """Run a step generator to completion and return its result."""
+    try:
+        while True:
+            next(steps)
+    except StopIteration as e:
+        return e.value
+
+
+async def _run_async(steps):
+    """Like _run(), letting other tasks run between the steps."""
+    try:
+        while True:
+            next(steps)
+            await asyncio.sleep(0)
+    except StopIteration as e:
+        return e.value
+
+
+class StaleDelta(ValueError):
+    """Raised when a delta does not apply to the current database version."""
+
+
+def _compare(buf, offset, digest):
+    """Compare buf[offset:offset + 32] with digest without slicing."""
+    for i in range(DIGEST_SIZE):
+        d = buf[offset + i] - digest[i]
+        if d:
+            return d
+    return 0
+
+
+class Bloom:
+    """
+    Bloom filter over SHA-256 digests used to reject unknown hashes early.
+
+    The digests are already uniformly distributed, so the k bit positions
+    are simply consecutive 32-bit words of the digest masked to the filter
+    size; no extra hashing is needed. A negative answer is authoritative,
+    a positive one must be confirmed against the table.
+    """
+
+    def __init__(self, count):
+        """
+        Initialize an empty filter sized for `count` entries.
+
+        Args:
+            count (int): Expected number of entries
+        """
+        size = BLOOM_MIN_BYTES
+        while size < BLOOM_MAX_BYTES and size * 8 < count * BLOOM_BITS_PER_ENTRY:
+            size <<= 1
+        self._bits = bytearray(size)
+        self._mask = size * 8 - 1
+        # optimal k = bits/entries * ln 2, capped by the 8 words in a digest
+        self._k = max(1, min(8, (size * 8 * 7) // (max(count, 1) * 10)))
+
+    def add(self, buf, offset=0):
+        """
+        Add the digest stored at buf[offset:offset + 32].
+
+        Args:
+            buf (bytes): Buffer holding the digest
+            offset (int): Offset of the digest in buf
+        """
+        bits = self._bits
+        mask = self._mask
+        for i in range(offset, offset + 4 * self._k, 4):
+            n = (buf[i] | buf[i + 1] << 8 | buf[i + 2] << 16 | buf[i + 3] << 24) & mask
+            bits[n >> 3] |= 1 << (n & 7)
+
+    def __contains__(self, digest):
+        """
+        Check whether a digest may be in the set.
+
+        Args:
+            digest (bytes): Raw SHA-256 digest
+
+        Returns:
+            bool: False if the digest is definitely absent
+        """
+        bits = self._bits
+        mask = self._mask
+        for i in range(0, 4 * self._k, 4):
+            n = (digest[i] | digest[i + 1] << 8 | digest[i + 2] << 16 | digest[i + 3] << 24) & mask
+            if not bits[n >> 3] & (1 << (n & 7)):
+                return False
+        return True
+
+
+class HashDb:
+    """
+    Sorted table of authorised SHA-256 digests with binary search lookup.
+
+    Small databases are loaded into a single bytearray (32 bytes per entry,
+    no per-entry objects); databases above `ram_limit` bytes stay on flash
+    and are probed with seek/readinto into a preallocated 32-byte buffer.
+    Either way a lookup costs O(log n) comparisons and allocates nothing.
+
+    A Bloom filter built alongside the table stays in RAM and rejects most
+    unknown hashes (unknown cards, wrong PINs) before the table is touched.
+
+    After a sync downloads a new file, await apply() or install(). The new
+    table is built on the side, yielding to other tasks every YIELD_EVERY
+    entries, and swapped in with a single assignment, so a lookup running
+    concurrently (the sync runs as its own task) always sees either the
+    complete old table or the complete new one.
+    """
+
+    def __init__(self, path=HASHES_FILE, ram_limit=RAM_TABLE_LIMIT):
+        """
+        Initialize and load the hash database.
+
+        Args:
+            path (str): Path of the hashes file (default: 'hashes')
+            ram_limit (int): Largest table size in bytes kept in RAM
+        """
+        self._path = path
+        self._ram_limit = ram_limit
+        self._probe = bytearray(DIGEST_SIZE)
+        # (version, count, table, file, bloom) swapped as a whole on reload
+        self._state = (0, 0, bytearray(), None, Bloom(0))
+        self.reload()
+
+    @property
+    def version(self):
+        """Database version from the file header (0 for legacy files)."""
+        return self._state[0]
+
+    def reload(self):
+        """
+        Re-read the hashes file and atomically replace the index.
+
+        A legacy text file is converted to the binary format in place.
+        A missing or unreadable file keeps the previous index, so a
+        failed sync never locks everybody out.
+
+        Returns:
+            bool: True if the index was replaced, False otherwise
+        """
+        try:
+            state = _run(self._load())
+        except (OSError, ValueError) as e:
+            print(f"hashdb: cannot load {self._path}: {e}")
+            return False
+        self._swap(state)
+        return True
+
+    async def reload_async(self):
+        """reload(), letting other tasks run while the table is read."""
+        try:
+            state = await _run_async(self._load())
+        except (OSError, ValueError) as e:
+            print(f"hashdb: cannot load {self._path}: {e}")
+            return False
+        self._swap(state)
+        return True
+
+    def _swap(self, state):
+        old = self._state
+        self._state = state
+        if old[3] is not None:
+            old[3].close()
+        print(f"hashdb: loaded {state[1]} hashes (version {state[0]})")
+
+    async def apply(self, new_path):
+        """
+        Make a downloaded sync payload the active database.
+
+        Dispatches on the file contents: a delta is merged into the current
+        table, anything else is treated as a full database.
+
+        Args:
+            new_path (str): Path of the downloaded file
+
+        Raises:
+            StaleDelta: If the payload is a delta for another version
+            ValueError: If the payload is not valid
+        """
+        with open(new_path, 'rb') as f:
+            is_delta = f.read(4) == DELTA_MAGIC
+        if is_delta:
+            await self.apply_delta(new_path)
+        else:
+            await self.install(new_path)
+
+    async def apply_delta(self, delta_path):
+        """
+        Merge a delta file into the current table and install the result.
+
+        The merged table is streamed to a new file in sorted order, so the
+        delta is applied without holding two copies of the table in RAM.
+        Only the added and removed digests are kept as separate objects.
+
+        Args:
+            delta_path (str): Path of the downloaded delta file
+
+        Raises:
+            StaleDelta: If the delta base is not the current version
+            ValueError: If the delta file is malformed
+        """
+        with open(delta_path, 'rb') as f:
+            header = f.read(DELTA_HEADER_SIZE)
+            if len(header) < DELTA_HEADER_SIZE:
+                raise ValueError("truncated delta header")
+            magic, fmt, _, base, version, n_add, n_remove = struct.unpack(DELTA_HEADER_FORMAT, header)
+            if magic != DELTA_MAGIC or fmt != FORMAT_VERSION:
+                raise ValueError("not a hashes delta")
+            if base != self.version:
+                raise StaleDelta("delta for version %d, have %d" % (base, self.version))
+            added = [f.read(DIGEST_SIZE) for _ in range(n_add)]
+            removed = [f.read(DIGEST_SIZE) for _ in range(n_remove)]
+            if f.read(1):
+                raise ValueError("trailing data in delta")
+        for d in added + removed:
+            if len(d) != DIGEST_SIZE:
+                raise ValueError("truncated delta")
+        added = sorted(set(added))
+        removed = set(removed)
+        n_add = len(added)
+        if not n_add and not removed and version == base:
+            print(f"hashdb: already at version {version}")
+            return
+
+        tmp = self._path + '_merge'
+        await _run_async(self._merge(tmp, version, added, removed))
+        print(f"hashdb: delta {base} -> {version}: +{n_add} -{n_remove}")
+        await self.install(tmp)
+
+    def _merge(self, tmp, version, added, removed):
+        # step generator writing the current table merged with a delta to tmp
+        _, count, table, _, _ = self._state
+        src = None
+        if table is None:
+            # separate handle, the active one belongs to lookups
+            src = open(self._path, 'rb')
+            src.seek(HEADER_SIZE)
+        n_add = len(added)
+        written = 0
+        a = 0
+        try:
+            with open(tmp, 'wb') as out:
+                out.write(bytes(HEADER_SIZE))
+                for i in range(count):
+                    if i % YIELD_EVERY == YIELD_EVERY - 1:
+                        yield
+                    if src is None:
+                        cur = bytes(table[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE])
+                    else:
+                        cur = src.read(DIGEST_SIZE)
+                    while a < n_add and added[a] < cur:
+                        out.write(added[a])
+                        written += 1
+                        a += 1
+                    if a < n_add and added[a] == cur:
+                        a += 1
+                    elif cur in removed:
+                        continue
+                    out.write(cur)
+                    written += 1
+                while a < n_add:
+                    out.write(added[a])
+                    written += 1
+                    a += 1
+                out.seek(0)
+                out.write(struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, 0, version, written))
+        finally:
+            if src is not None:
+                src.close()
+
+    async def install(self, new_path):
+        """
+        Validate a freshly downloaded file and make it the active database.
+
+        Binary files are checked for a consistent header and size, text
+        files are converted. A text file with a malformed line or without
+        any entry (an error page, a garbage body) is rejected rather than
+        installed as an empty database. The file then replaces the hashes
+        file with an atomic rename and the index is reloaded.
+
+        Args:
+            new_path (str): Path of the downloaded file
+
+        Raises:
+            ValueError: If the file is not a valid hashes database
+        """
+        with open(new_path, 'rb') as f:
+            header = _read_header(f)
+        if header is None:
+            try:
+                with open(new_path) as f:
+                    digests = parse_text(f, strict=True)
+            except UnicodeError:
+                raise ValueError("hashes file is neither binary nor text")
+            if not digests:
+                raise ValueError("no hashes in text file")
+            data = pack(digests)
+            with open(new_path, 'wb') as f:
+                f.write(data)
+        else:
+            size = os.stat(new_path)[6]
+            if size != HEADER_SIZE + header[1] * DIGEST_SIZE:
+                raise ValueError("truncated hashes file")
+
+        os.rename(new_path, self._path)
+        if not await self.reload_async():
+            raise ValueError("installed hashes file did not load")
+
+    def _load(self):
+        # step generator returning the new state
+        with open(self._path, 'rb') as f:
+            header = _read_header(f)
+        if header is None:
+            self._convert()
+            with open(self._path, 'rb') as f:
+                header = _read_header(f)
+
+        version, count = header
+        size = count * DIGEST_SIZE
+        if os.stat(self._path)[6] != HEADER_SIZE + size:
+            raise ValueError("truncated hashes file")
+
+        bloom = Bloom(count)
+        f = open(self._path, 'rb')
+        if size > self._ram_limit:
+            probe = bytearray(DIGEST_SIZE)
+            f.seek(HEADER_SIZE)
+            for i in range(count):
+                if i % YIELD_EVERY == YIELD_EVERY - 1:
+                    yield
+                f.readinto(probe)
+                bloom.add(probe)
+            return (version, count, None, f, bloom)
+        try:
+            f.seek(HEADER_SIZE)
+            table = bytearray(size)
+            f.readinto(table)
+        finally:
+            f.close()
+        step = YIELD_EVERY * DIGEST_SIZE
+        for offset in range(0, size, DIGEST_SIZE):
+            if offset % step == step - DIGEST_SIZE:
+                yield
+            bloom.add(table, offset)
+        return (version, count, table, None, bloom)
+
+    def _convert(self):
+        print(f"hashdb: converting {self._path} to binary format")
+        with open(self._path) as f:
+            data = pack(parse_text(f))
+        tmp = self._path + '_conv'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, self._path)
+
+    def __contains__(self, digest):
+        """
+        Check whether a raw 32-byte digest is authorised.
+
+        Args:
+            digest (bytes): Raw SHA-256 digest
+
+        Returns:
+            bool: True if the digest is in the database
+        """
+        version, count, table, f, bloom = self._state
+        if digest not in bloom:
+            return False
+        probe = self._probe
+        lo = 0
+        hi = count
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if f is None:
+                c = _compare(table, mid * DIGEST_SIZE, digest)
+            else:
+                f.seek(HEADER_SIZE + mid * DIGEST_SIZE)
+                f.readinto(probe)
+                c = _compare(probe, 0, digest)
+            if c < 0:
+                lo = mid + 1
+            elif c > 0:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __len__(self):
+        return self._state[1]
@@ -0,0 +1,105 @@
+"""
+Doorman2 Metrics Module for ESP32
+Counters and fixed-bucket latency histograms for the hot paths, published
+periodically over MQTT by Net
+"""
+
+import json
+import time
+from array import array
+
+# Upper bounds of the histogram buckets in microseconds; one more bucket
+# collects everything above the last bound
+BUCKETS_US = (100, 300, 1000, 3000, 10000, 30000, 100000, 300000,
+              1000000, 3000000, 10000000)
+
+
+class Counter:
+    """Monotonic event counter."""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Histogram:
+    """
+    Latency histogram with the fixed BUCKETS_US buckets.
+
+    Counts live in a preallocated array and are found with a short linear
+    scan, so observe() allocates nothing. Only count, max and the bucket
+    counts are kept; a running sum would outgrow MicroPython's small ints.
+    """
+
+    def __init__(self):
+        self.counts = array('L', [0] * (len(BUCKETS_US) + 1))
+        self.count = 0
+        self.max = 0
+
+    def observe(self, us):
+        """Record one duration in microseconds."""
+        i = 0
+        for bound in BUCKETS_US:
+            if us <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        if us > self.max:
+            self.max = us
+
+    def since(self, start_us):
+        """Record the time elapsed since a time.ticks_us() reading."""
+        self.observe(time.ticks_diff(time.ticks_us(), start_us))
+
+
+class Metrics:
+    """
+    Registry of named counters and histograms.
+
+    Instrumented code looks its metrics up once, at import or construction
+    time, and keeps the objects, so the hot path is a method call and an
+    integer increment. Values are cumulative since boot; consumers compute
+    rates from consecutive snapshots.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._boot = time.ticks_ms()
+
+    def counter(self, name):
+        """Return the counter called name, creating it if needed."""
+        c = self._counters.get(name)
+        if c is None:
+            c = self._counters[name] = Counter()
+        return c
+
+    def histogram(self, name):
+        """Return the histogram called name, creating it if needed."""
+        h = self._histograms.get(name)
+        if h is None:
+            h = self._histograms[name] = Histogram()
+        return h
+
+    def snapshot(self):
+        """
+        Serialize all metrics for publishing.
+
+        Returns:
+            bytes: JSON object {"uptime_s": int, "buckets_us": [bounds],
+            "counters": {name: value}, "histograms": {name: [count, max_us,
+            bucket counts...]}}
+        """
+        return json.dumps({
+            'uptime_s': time.ticks_diff(time.ticks_ms(), self._boot) // 1000,
+            'buckets_us': BUCKETS_US,
+            'counters': {name: c.value for name, c in self._counters.items()},
+            'histograms': {name: [h.count, h.max] + list(h.counts) for name, h in self._histograms.items()},
+        }).encode()
+
+
+# Shared by all modules of the lock
+metrics = Metrics()
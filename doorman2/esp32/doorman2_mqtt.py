@@ -0,0 +1,231 @@
+"""
+Doorman2 MQTT Client Module for ESP32
+Minimal asyncio-native MQTT 3.1.1 client (QoS 0 only)
+"""
+
+import asyncio
+import struct
+import time
+
+# Control packet types (high nibble of the fixed header)
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+SUBSCRIBE = 0x82  # reserved flags 0b0010
+SUBACK = 0x90
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+
+class MQTTException(Exception):
+    pass
+
+
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return out
+
+
+def _encode_str(s):
+    if isinstance(s, str):
+        s = s.encode()
+    return struct.pack('!H', len(s)) + s
+
+
+class MQTTClient:
+    """
+    Asyncio MQTT client running on the same event loop as auth and NFC.
+
+    All I/O goes through non-blocking asyncio streams: publish() is
+    awaitable and wait_msg() suspends until a packet arrives, so there is
+    no polling interval and no second thread. Only QoS 0 is supported,
+    which is all the lock uses.
+
+    Incoming PUBLISH packets are passed to the callback set with
+    set_callback(), with topic and message as bytes like umqtt.simple.
+
+    The client does not close dead sessions by itself: the owner checks
+    ping_overdue() and calls close() when the broker stops answering.
+    """
+
+    def __init__(self, client_id, server, port=1883, keepalive=0, timeout_ms=5000):
+        """
+        Initialize the client; no connection is made yet.
+
+        Args:
+            client_id (str): MQTT client identifier
+            server (str): Broker host name or address
+            port (int): Broker TCP port (default: 1883)
+            keepalive (int): Keepalive interval in seconds, 0 to disable
+            timeout_ms (int): Longest wait for the TCP connection, for the
+                CONNACK and for a write to drain
+        """
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.keepalive = keepalive
+        self.timeout_ms = timeout_ms
+        self._cb = None
+        self._reader = None
+        self._writer = None
+        self._pid = 0
+        self._ping_at = None  # ticks_ms of the oldest unanswered PINGREQ
+
+    def set_callback(self, cb):
+        self._cb = cb
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def connect(self, clean_session=True):
+        """
+        Open the TCP connection and perform the MQTT handshake.
+
+        Args:
+            clean_session (bool): Ask the broker to discard session state
+
+        Returns:
+            bool: True if the broker resumed a previous session
+
+        Raises:
+            MQTTException: If the broker refuses the connection
+            asyncio.TimeoutError: If the connection or the CONNACK take
+                longer than timeout_ms
+        """
+        self._reader, self._writer = await asyncio.wait_for_ms(
+            asyncio.open_connection(self.server, self.port), self.timeout_ms)
+        self._ping_at = None
+        try:
+            var = b'\x00\x04MQTT\x04' + bytes([0x02 if clean_session else 0x00]) + struct.pack('!H', self.keepalive)
+            payload = _encode_str(self.client_id)
+            await self._send(CONNECT, var + payload)
+
+            header = await asyncio.wait_for_ms(self._reader.readexactly(4), self.timeout_ms)
+            if header[0] != CONNACK or header[1] != 2:
+                raise MQTTException("unexpected reply to CONNECT")
+            if header[3]:
+                raise MQTTException("connection refused: %d" % header[3])
+            return bool(header[2] & 0x01)
+        except Exception:
+            await self.close()
+            raise
+
+    async def close(self):
+        """Drop the TCP connection without sending DISCONNECT."""
+        writer = self._writer
+        self._reader = self._writer = None
+        if writer is not None:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def disconnect(self):
+        """Send DISCONNECT and close the connection."""
+        try:
+            await self._send(DISCONNECT, b'')
+        finally:
+            await self.close()
+
+    async def publish(self, topic, msg, retain=False):
+        """
+        Publish a message with QoS 0.
+
+        Args:
+            topic (str or bytes): Topic name
+            msg (str or bytes): Message payload
+            retain (bool): Ask the broker to retain the message
+        """
+        if isinstance(msg, str):
+            msg = msg.encode()
+        await self._send(PUBLISH | (0x01 if retain else 0x00), _encode_str(topic), msg)
+
+    async def subscribe(self, topic):
+        """
+        Subscribe to a topic with QoS 0.
+
+        The SUBACK is consumed by wait_msg(), so this does not block on
+        a broker round trip.
+
+        Args:
+            topic (str or bytes): Topic filter
+        """
+        self._pid = (self._pid % 0xFFFF) + 1
+        await self._send(SUBSCRIBE, struct.pack('!H', self._pid) + _encode_str(topic) + b'\x00')
+
+    async def ping(self):
+        """Send PINGREQ; the PINGRESP is consumed by wait_msg()."""
+        await self._send(PINGREQ, b'')
+        if self._ping_at is None:
+            self._ping_at = time.ticks_ms()
+
+    def ping_overdue(self, limit_ms):
+        """
+        Check whether a PINGREQ has gone unanswered for too long.
+
+        Args:
+            limit_ms (int): Longest acceptable wait for the PINGRESP
+
+        Returns:
+            bool: True if the oldest unanswered PINGREQ is older than limit_ms
+        """
+        return self._ping_at is not None and time.ticks_diff(time.ticks_ms(), self._ping_at) > limit_ms
+
+    async def wait_msg(self):
+        """
+        Wait for and handle the next packet from the broker.
+
+        Returns:
+            int: Packet type that was handled
+
+        Raises:
+            OSError: If the connection is closed
+        """
+        reader = self._reader
+        if reader is None:
+            raise OSError("not connected")
+        first = (await reader.readexactly(1))[0]
+
+        length = 0
+        shift = 0
+        while True:
+            b = (await reader.readexactly(1))[0]
+            length |= (b & 0x7F) << shift
+            if not b & 0x80:
+                break
+            shift += 7
+        body = await reader.readexactly(length) if length else b''
+
+        kind = first & 0xF0
+        if kind == PINGRESP:
+            self._ping_at = None
+        elif kind == PUBLISH:
+            topic_len = (body[0] << 8) | body[1]
+            topic = body[2:2 + topic_len]
+            # QoS 0 only, so no packet identifier follows the topic
+            msg = body[2 + topic_len:]
+            if self._cb is not None:
+                self._cb(topic, msg)
+        return kind
+
+    async def _send(self, kind, var, payload=b''):
+        writer = self._writer
+        if writer is None:
+            raise OSError("not connected")
+        writer.write(bytes([kind]) + _encode_length(len(var) + len(payload)) + var)
+        if payload:
+            writer.write(payload)
+        try:
+            await asyncio.wait_for_ms(writer.drain(), self.timeout_ms)
+        except asyncio.TimeoutError:
+            # a half-open socket, the session is gone
+            await self.close()
+            raise
@@ -5,17 +5,137 @@ Supports both PN532 and PN7150 NFC readers with unified interface
 """
 
 import asyncio
+import time
+
+from doorman2_metrics import metrics
 
 # Static configuration - set to "pn7150" or "pn532"
 NFC_READER_TYPE = "pn7150"  # Change this to "pn532" if using PN532 instead
 
+# A card or phone left on the reader is reactivated as soon as discovery
+# restarts; the same UID or HCE token read again within this long of its
+# last read is not reported again
+NFC_REPEAT_MS = 1500
+
+# PN7150 I2C link; both are self-tested at startup and fall back to
+# 100 kHz / two-transaction reads if the bus can't take them
+NFC_I2C_FREQ = 400000
+# Burst reads stay off: the self-test only exchanges a short CORE_GET_CONFIG
+# response, so frames longer than the burst (activations with an ATS, HCE
+# responses) and two frames queued back to back are not covered by it
+NFC_I2C_BURST = 0
+
+# SELECT by AID for the Mermaid Sesame HCE app (F1726576406873, as used in
+# the continuous scanner), built once and sent as is for every phone
+HCE_AID = bytes([0xF1, 0x72, 0x65, 0x76, 0x40, 0x68, 0x73])
+HCE_SELECT_APDU = bytes([0x00, 0xA4, 0x04, 0x00, len(HCE_AID)]) + HCE_AID
+HCE_OK = b'\x90\x00'
+
+# PN7150 watchdog
+NFC_PROBE_MS = 5000         # Probe the reader after this long without traffic
+NFC_MAX_ERROR_NTFS = 5      # NCI error notifications per probe interval before resetting
+NFC_ESCALATE_MS = 30000     # A new fault within this long starts at the next reset level
+NFC_RETRY_MS = 5000         # Delay between full re-inits while the reader stays dead
+
 # Import PN7150 constants at module level
 try:
-    from lib_PN7150 import lib_PN7150, RfIntf_t, SUCCESS, MODE_POLL, TECH_PASSIVE_NFCA, PROT_ISODEP
+    from lib_PN7150 import (lib_PN7150, RfIntf_t, SUCCESS, MODE_POLL, TECH_PASSIVE_NFCA,
+                            PROT_ISODEP, RFST_DISCOVERY, RESET_NCI, RESET_FULL)
     PN7150_AVAILABLE = True
 except ImportError:
     PN7150_AVAILABLE = False
 
+_reads = metrics.histogram('nfc.read_us')        # activation to UID/HCE token
+_cards = metrics.counter('nfc.cards')
+_hce = metrics.counter('nfc.hce')
+_read_failures = metrics.counter('nfc.read_failures')
+_repeats = metrics.counter('nfc.repeats')        # suppressed by NFC_REPEAT_MS
+_faults = metrics.counter('nfc.faults')
+_resets = (metrics.counter('nfc.resets.nci'), metrics.counter('nfc.resets.ven'),
+           metrics.counter('nfc.resets.full'))
+_recoveries = metrics.histogram('nfc.recovery_us')
+_downtime = metrics.counter('nfc.downtime_ms')
+
+class ReaderWatchdog:
+    """
+    Health monitor for the PN7150 with escalating in-place recovery.
+    
+    The reader is considered faulty when it stops answering a probe
+    command after a quiet period, when it sends a burst of NCI error
+    notifications, or when the NFC loop reports a failed command or I2C
+    error. Recovery escalates from an NCI core reset to a VEN power cycle
+    to a full re-initialization; a fault shortly after a recovery starts
+    one level higher, since the previous level evidently did not help.
+    
+    Faults, resets per level, recovery times and total downtime are
+    counted in the nfc.* metrics.
+    """
+    
+    def __init__(self, reader, restart):
+        """
+        Args:
+            reader (lib_PN7150): Reader to monitor
+            restart (coroutine function): Configures and starts discovery
+                after a reset, returns True on success
+        """
+        self._reader = reader
+        self._restart = restart
+        self._last_ok = time.ticks_ms()
+        self._errors = reader.errorCount
+        self._level = RESET_NCI
+        self._last_recovery = None
+    
+    def alive(self):
+        """Note that the reader just did something useful."""
+        self._last_ok = time.ticks_ms()
+    
+    async def check(self):
+        """
+        Check the reader's health; cheap unless a probe is due.
+        
+        Returns:
+            bool: False if the reader needs to be recovered
+        """
+        reader = self._reader
+        if reader.errorCount - self._errors >= NFC_MAX_ERROR_NTFS:
+            print(f"nfc: {reader.errorCount - self._errors} NCI errors, last 0x{reader.lastError:02x}")
+            return False
+        if time.ticks_diff(time.ticks_ms(), self._last_ok) < NFC_PROBE_MS:
+            return True
+        self._errors = reader.errorCount
+        if await reader.probe():
+            self.alive()
+            return True
+        print("nfc: reader not answering")
+        return False
+    
+    async def recover(self):
+        """Reset the reader until discovery runs again, escalating as needed."""
+        _faults.inc()
+        start = time.ticks_ms()
+        level = RESET_NCI
+        if self._last_recovery is not None and time.ticks_diff(start, self._last_recovery) < NFC_ESCALATE_MS:
+            level = min(self._level + 1, RESET_FULL)
+        
+        while True:
+            _resets[level - 1].inc()
+            if await self._reader.reset(level) == SUCCESS and await self._restart():
+                break
+            if level < RESET_FULL:
+                level += 1
+            else:
+                # chip or bus gone for good, keep trying without hogging the loop
+                await asyncio.sleep_ms(NFC_RETRY_MS)
+        
+        elapsed = time.ticks_diff(time.ticks_ms(), start)
+        _recoveries.observe(elapsed * 1000)
+        _downtime.inc(elapsed)
+        self._level = level
+        self._last_recovery = time.ticks_ms()
+        self._errors = self._reader.errorCount
+        self.alive()
+        print(f"nfc: reader recovered at reset level {level} in {elapsed} ms")
+
 class Nfc:
     """
     Unified NFC reader class supporting both PN532 and PN7150.
@@ -45,6 +165,8 @@ class Nfc:
         self._flag = asyncio.Event()
         self._reader_type = NFC_READER_TYPE
         self._reader = None
+        self._last_uid = None     # last identifier read
+        self._last_time = 0       # when it was last read
         
         print(f"NFC Reader configured: {self._reader_type}")
 
@@ -96,43 +218,84 @@ class Nfc:
             raise ImportError("PN7150 library not available")
         
         # Initialize PN7150 with default configuration
-        self._reader = lib_PN7150(IRQpin=15, VENpin=14, SCLpin=22, SDApin=21, I2Caddress=0x28)
+        self._reader = lib_PN7150(IRQpin=15, VENpin=14, SCLpin=22, SDApin=21, I2Caddress=0x28,
+                                  i2c_freq=NFC_I2C_FREQ, burst=NFC_I2C_BURST)
         self._reader_type = "pn7150"
         
-        # Configure for Read/Write mode
-        if self._reader.ConfigMode(1) != SUCCESS:
-            raise Exception("Failed to configure PN7150 mode")
-        
-        # Start discovery
-        if self._reader.StartDiscovery(1) != SUCCESS:
+        # Configure for Read/Write mode and start discovery
+        if not await self._start_pn7150():
             raise Exception("Failed to start PN7150 discovery")
         
         print("Using PN7150 NFC reader")
         
+        self.watchdog = watchdog = ReaderWatchdog(self._reader, self._start_pn7150)
         rf_intf = RfIntf_t()
         
         while True:
-            # Wait for card detection with 250ms timeout
-            if self._reader.WaitForDiscoveryNotification(rf_intf, 250):
-                # Check if it's HCE (Android phone) or physical card
-                if rf_intf.Protocol == PROT_ISODEP:
-                    # It's an HCE device - get HCE response data
-                    hce_data = await self._get_hce_response()
-                    if hce_data:
-                        self._uids.append(hce_data)
-                        self._flag.set()
-                else:
-                    # It's a physical card - extract UID
-                    uid = self._extract_uid_pn7150(rf_intf)
-                    if uid:
-                        self._uids.append(uid)
-                        self._flag.set()
-                
-                # Restart discovery for next card
-                self._reader.StopDiscovery()
-                self._reader.StartDiscovery(1)
-            
-            await asyncio.sleep(0.25)
+            try:
+                await self._read_pn7150(rf_intf, watchdog)
+            except OSError as e:
+                print(f"nfc: I2C error: {e}")
+                await watchdog.recover()
+
+    async def _start_pn7150(self):
+        """Configure Read/Write mode and start discovery; True on success."""
+        return (self._reader.ConfigMode(1) == SUCCESS and
+                await self._reader.start_discovery(1) == SUCCESS)
+
+    async def _read_pn7150(self, rf_intf, watchdog):
+        """
+        Wait for one tag and read its UID or HCE response.
+        
+        The identifier is queued for wait_uid() unless it was already read
+        within NFC_REPEAT_MS. Discovery then restarts straight from the
+        active state with the field left on, so a failed HCE select is
+        retried as soon as the phone is activated again.
+        
+        Returns:
+            bytes or None: Card identifier, None if nothing was read
+        """
+        reader = self._reader
+        
+        # Wait for card detection; the driver yields to the event loop
+        # while waiting, so keypad, door and network keep running
+        if not await reader.wait_for_tag(rf_intf, 1000):
+            if not await watchdog.check():
+                await watchdog.recover()
+            elif reader.rfState != RFST_DISCOVERY and await reader.restart_discovery() != SUCCESS:
+                await watchdog.recover()
+            return None
+        watchdog.alive()
+        start = time.ticks_us()
+        
+        # Check if it's HCE (Android phone) or physical card
+        if rf_intf.Protocol == PROT_ISODEP:
+            # It's an HCE device - get HCE response data
+            uid = await self._get_hce_response()
+            _hce.inc()
+        else:
+            # It's a physical card - extract UID
+            uid = self._extract_uid_pn7150(rf_intf)
+            _cards.inc()
+        _reads.since(start)
+        if not uid:
+            _read_failures.inc()
+        else:
+            now = time.ticks_ms()
+            # compared by identifier, not NFCID1: phones pick a random one
+            if uid != self._last_uid or time.ticks_diff(now, self._last_time) >= NFC_REPEAT_MS:
+                self._uids.append(uid)
+                self._flag.set()
+            else:
+                _repeats.inc()
+            # a tag left in the field keeps being read, so it stays
+            # suppressed until it has been gone for NFC_REPEAT_MS
+            self._last_uid = uid
+            self._last_time = now
+        
+        if await reader.restart_discovery() != SUCCESS:
+            await watchdog.recover()
+        return uid
 
     async def _loop_pn532(self):
         """
@@ -172,8 +335,8 @@ class Nfc:
         """
         Extract UID from PN7150 RF interface response.
         
-        This method parses the PN7150 response to extract the card UID,
-        similar to the logic used in the continuous scanner.
+        The UID is the NFCID1 decoded from the activation notification by
+        the driver (rf_intf.Tag), using the length fields of the frame.
         
         IMPORTANT: Returns variable length UIDs (4, 7, or 10 bytes) just like PN532.
         The main application handles this by using only the first 4 bytes for hash generation.
@@ -182,51 +345,14 @@ class Nfc:
             rf_intf: RfIntf_t object containing tag information
             
         Returns:
-            bytearray: Card UID bytes (variable length), or None if extraction fails
+            bytes: Card UID bytes (variable length), or None if extraction fails
         """
         # Check if it's NFC-A technology
         if not PN7150_AVAILABLE:
             return None
         if rf_intf.ModeTech != (MODE_POLL | TECH_PASSIVE_NFCA):
             return None
-        
-        # Extract UID from the raw response buffer
-        response = self._reader.rxBuffer
-        length = self._reader.rxMessageLength
-        
-        if length < 17:  # Need at least 17 bytes for UID
-            return None
-        
-        # Analyze response structure to find UID position
-        # For MIFARE: UID is at positions 13-16 (4 bytes)
-        # For NTAG: UID might be at different position due to longer response
-        
-        uid_start = 13
-        uid_length = 4
-        
-        # Look for specific patterns in longer responses
-        if length >= 20:
-            if response[11] == 0x04 and response[12] == 0x00 and response[13] == 0x04:
-                # MIFARE pattern: 0x04 0x00 0x04 [UID]
-                uid_start = 14
-                uid_length = 4
-            elif response[12] == 0x07 and response[13] == 0x04:
-                # NTAG pattern: 0x07 0x04 [UID]
-                uid_start = 13
-                uid_length = 7
-            elif length >= 25:  # Check for longer UIDs (10 bytes)
-                # Some cards might have longer UIDs
-                if response[11] == 0x0A and response[12] == 0x04:
-                    uid_start = 13
-                    uid_length = 10
-        
-        # Extract UID if we have enough data
-        if length >= uid_start + uid_length:
-            uid = response[uid_start:uid_start + uid_length]
-            # Ensure we return the full UID length (main app will take [:4] as needed)
-            return uid
-        
-        return None
+        return rf_intf.Tag.uid()
 
     async def _get_hce_response(self):
         """
@@ -238,26 +364,19 @@ class Nfc:
         Returns:
             bytearray: HCE response data, or None if no response
         """
-        # Mermaid Sesame HCE AID (as used in the continuous scanner)
-        mermaid_aid = bytearray([0xF1, 0x72, 0x65, 0x76, 0x40, 0x68, 0x73])  # F1726576406873
-        
         try:
-            # Send SELECT APDU command
-            aid_length = len(mermaid_aid)
-            select_cmd = bytearray([0x00, 0xA4, 0x04, 0x00, aid_length]) + mermaid_aid
-            
-            # Use SendApduCommand to send APDU
-            response = self._reader.SendApduCommand(select_cmd)
+            # Send the SELECT APDU without blocking the event loop
+            response = await self._reader.transceive(HCE_SELECT_APDU)
             
             if response:
                 # Check for success status (last 2 bytes should be 0x90 0x00)
                 if len(response) >= 2:
                     status = response[-2:]
-                    if status == bytearray([0x90, 0x00]):
-                        # Return the response data without status bytes
-                        hce_data = response[:-2]
-                        print(f"HCE Response received: {len(hce_data)} bytes")
-                        return hce_data
+                    if status == HCE_OK:
+                        # Return the response data without status bytes;
+                        # not logged, a phone left on the reader is
+                        # selected again on every activation
+                        return response[:-2]
                     else:
                         print(f"HCE Status failed: {status.hex()}")
                         return None
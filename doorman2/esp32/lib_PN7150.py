@@ -12,8 +12,18 @@ Version: 1.0
 """
 
 from machine import I2C, Pin
+import asyncio
+import binascii
+import hashlib
+import micropython
 import time
 
+try:
+    from doorman2_metrics import metrics
+except ImportError:
+    # driver used on its own, without the lock's metrics registry
+    metrics = None
+
 # =============================================================================
 # CORE CONSTANTS
 # =============================================================================
@@ -21,6 +31,21 @@ import time
 # Pin configuration constants
 NO_PN7150_RESET_PIN = 255  # Value indicating no reset pin is used
 
+# I2C bus configuration
+I2C_FREQ_STANDARD = 100000  # Standard mode, always works
+I2C_FREQ_FAST = 400000      # Fast mode, supported by the PN7150
+I2C_SELFTEST_ROUNDS = 8     # Exchanges checked before trusting a faster link
+
+# Recovery levels for reset(), in escalation order
+RESET_NCI = 1    # CORE_RESET + CORE_INIT, then reconfigure
+RESET_VEN = 2    # Power cycle through VEN first
+RESET_FULL = 3   # Reopen the I2C bus and run the complete initialization
+
+# Startup
+NCI_CONNECT_RETRY_MS = 20       # Delay between CORE_RESET attempts
+NCI_CONNECT_TIMEOUT_MS = 1000   # Give up connecting after this long
+CONFIG_FINGERPRINT_SIZE = 8     # Bytes of the NXP timestamp/config ID parameter (A0 14)
+
 # Status codes
 NFC_SUCCESS = 0    # Operation completed successfully
 NFC_ERROR = 1      # Operation failed
@@ -33,6 +58,9 @@ TIMEOUT_2S = 2000  # 2 second timeout in milliseconds
 # NCI Protocol constants
 MAX_NCI_FRAME_SIZE = 258  # Maximum NCI frame size in bytes
 
+# IRQ-driven reception
+FRAME_QUEUE_SIZE = 4      # Frames buffered by the IRQ handler before getMessage() picks them up
+
 # =============================================================================
 # OPERATION MODE FLAGS
 # =============================================================================
@@ -88,6 +116,39 @@ INTF_ISODEP = 0x2        # ISO-DEP interface
 INTF_NFCDEP = 0x3        # NFC-DEP interface
 INTF_TAGCMD = 0x80       # Tag command interface
 
+# =============================================================================
+# RF STATES
+# =============================================================================
+
+# NCI RF Communication state machine (NCI 1.0 section 5.2), tracked from
+# the responses and notifications the PN7150 sends
+RFST_IDLE = 0                # Discovery stopped
+RFST_DISCOVERY = 1           # Polling/listening for remote endpoints
+RFST_W4_ALL_DISCOVERIES = 2  # Several tags found, more RF_DISCOVER_NTFs follow
+RFST_W4_HOST_SELECT = 3      # Several tags found, waiting for RF_DISCOVER_SELECT_CMD
+RFST_POLL_ACTIVE = 4         # A tag is activated
+RFST_LISTEN_ACTIVE = 5       # Activated by a remote reader
+RFST_LISTEN_SLEEP = 6        # Remote reader put us to sleep
+
+# RF_DEACTIVATE types
+DEACTIVATE_IDLE = 0x00
+DEACTIVATE_SLEEP = 0x01
+DEACTIVATE_SLEEP_AF = 0x02
+DEACTIVATE_DISCOVERY = 0x03
+
+# =============================================================================
+# TRACE LEVELS
+# =============================================================================
+
+TRACE_OFF = 0      # No tracing, the fast path only compares an int
+TRACE_ERRORS = 1   # Failed exchanges and the frame that caused them
+TRACE_FRAMES = 2   # Every NCI frame sent or received
+
+# Trace record kinds
+TRACE_TX = 0       # Frame written to the PN7150
+TRACE_RX = 1       # Frame read from the PN7150
+TRACE_ERR = 2      # Exchange failed, data is the last frame received
+
 # =============================================================================
 # MESSAGE SIZE CONSTANTS
 # =============================================================================
@@ -124,8 +185,50 @@ DiscoveryTechnologiesP2P = [  # Peer-to-peer technologies
 
 # Global state variables for NCI communication
 gNextTag_Protocol = PROT_UNDETERMINED  # Next tag protocol to process
-NCIStartDiscovery_length = 0           # Length of discovery command
-NCIStartDiscovery = bytearray(30)      # Discovery command buffer
+
+# =============================================================================
+# NCI COMMAND TEMPLATES
+# =============================================================================
+#
+# Constant commands are immutable and written to the bus as they are.
+# Commands with variable fields are copied into the reusable TX frame and
+# patched in place, so no command is rebuilt per call.
+
+NCI_CORE_RESET = bytes([0x20, 0x00, 0x01, 0x01])         # CORE_RESET_CMD, reset configuration
+NCI_CORE_INIT = bytes([0x20, 0x01, 0x00])                # CORE_INIT_CMD
+NCI_CORE_GET_TOTAL_DURATION = bytes([0x20, 0x03, 0x02, 0x01, 0x00])  # CORE_GET_CONFIG_CMD, TOTAL_DURATION
+NCI_GET_FINGERPRINT = bytes([0x20, 0x03, 0x03, 0x01, 0xA0, 0x14])   # CORE_GET_CONFIG_CMD, NXP timestamp/config ID
+NCI_SET_FINGERPRINT = bytes([0x20, 0x02, 4 + CONFIG_FINGERPRINT_SIZE, 0x01, 0xA0, 0x14,
+                             CONFIG_FINGERPRINT_SIZE])  # CORE_SET_CONFIG_CMD, fingerprint follows
+NCI_PROP_ACT = bytes([0x2F, 0x02, 0x00])                 # NCI_PROPRIETARY_ACT_CMD
+NCI_RF_DEACTIVATE_IDLE = bytes([0x21, 0x06, 0x01, 0x00])       # RF_DEACTIVATE_CMD, idle mode
+NCI_RF_DEACTIVATE_DISCOVERY = bytes([0x21, 0x06, 0x01, 0x03])  # RF_DEACTIVATE_CMD, discovery
+NCI_RF_DISCOVER_SELECT = bytes([0x21, 0x04, 0x03, 0x01, PROT_ISODEP, INTF_ISODEP])  # RF_DISCOVER_SELECT_CMD
+NCI_DATA_HEADER = bytes([0x00, 0x00, 0x00])              # DATA_PACKET on the static RF connection, length patched
+
+# RF_DISCOVER_MAP_CMD per operating mode: (protocol, mode, interface) entries
+NCI_DISCOVER_MAP_RW = bytes([
+    0x21, 0x00, 0x10, 0x05,
+    PROT_T1T, 0x01, INTF_FRAME,
+    PROT_T2T, 0x01, INTF_FRAME,
+    PROT_T3T, 0x01, INTF_FRAME,
+    PROT_ISODEP, 0x01, INTF_ISODEP,
+    PROT_MIFARE, 0x01, INTF_TAGCMD
+])
+NCI_DISCOVER_MAP_CE = bytes([0x21, 0x00, 0x04, 0x01, PROT_ISODEP, 0x02, INTF_ISODEP])
+NCI_DISCOVER_MAP_P2P = bytes([0x21, 0x00, 0x04, 0x01, PROT_NFCDEP, 0x03, INTF_NFCDEP])
+
+def _discover_cmd(techs):
+    """Build an RF_DISCOVER_CMD polling each technology every period."""
+    cmd = bytearray([0x21, 0x03, len(techs) * 2 + 1, len(techs)])
+    for tech in techs:
+        cmd.append(tech)
+        cmd.append(0x01)
+    return bytes(cmd)
+
+NCI_DISCOVER_RW = _discover_cmd(DiscoveryTechnologiesRW)
+NCI_DISCOVER_CE = _discover_cmd(DiscoveryTechnologiesCE)
+NCI_DISCOVER_P2P = _discover_cmd(DiscoveryTechnologiesP2P)
 
 # =============================================================================
 # NCI CONFIGURATION ARRAYS
@@ -183,6 +286,12 @@ NxpNci_RF_CONF_2ndGen = bytearray([
     0xA0, 0x0D, 0x06, 0x0A, 0x33, 0x80, 0x86, 0x00, 0x70   # RF_CLIF_CFG_I_ACTIVE CLIF_AGC_CONFIG0_REG
 ])
 
+# Blocking waits in getMessage() stall the event loop, so they are timed
+if metrics:
+    _syncWaits = metrics.histogram('pn7150.get_message_us')
+    _frames = metrics.counter('pn7150.frames')
+    _timeouts = metrics.counter('pn7150.timeouts')
+
 # =============================================================================
 # NCI DATA STRUCTURES
 # =============================================================================
@@ -253,6 +362,132 @@ class RfIntf_Info_t:
         self.NFC_FPP = RfIntf_info_FPP_t()  # Type F protocol info
         self.NFC_VPP = RfIntf_info_VPP_t()  # Type V protocol info
 
+# RF_INTF_ACTIVATED_NTF layout (offsets into the whole frame)
+ACT_MODE_TECH = 6    # Activation RF Technology and Mode
+ACT_PARAMS_LEN = 9   # Length of RF Technology Specific Parameters
+ACT_PARAMS = 10      # RF Technology Specific Parameters start here
+
+# Fields of the technology specific parameters
+FIELD_SKIP = 0       # Not kept (bit rate, AFI, DSFID)
+FIELD_SENS_RES = 1   # SENS_RES / SENSB_RES / SENSF_RES
+FIELD_NFCID = 2      # NFCID1 / ISO15693 UID
+FIELD_SEL_RES = 3    # SEL_RES (SAK)
+
+# Layout of the technology specific parameters per Activation RF Technology
+# and Mode: (field, size) steps, size 0 means a length byte comes first
+TECH_PARAMS = {
+    MODE_POLL | TECH_PASSIVE_NFCA: ((FIELD_SENS_RES, 2), (FIELD_NFCID, 0), (FIELD_SEL_RES, 0)),
+    MODE_POLL | TECH_PASSIVE_NFCB: ((FIELD_SENS_RES, 0),),
+    MODE_POLL | TECH_PASSIVE_NFCF: ((FIELD_SKIP, 1), (FIELD_SENS_RES, 0)),
+    MODE_POLL | TECH_PASSIVE_15693: ((FIELD_SKIP, 1), (FIELD_SKIP, 1), (FIELD_NFCID, 8)),
+}
+
+# Technologies whose NFCID leads the SENS_RES (NFCID0 for B, NFCID2 for F)
+NFCID_IN_SENS_RES = {
+    MODE_POLL | TECH_PASSIVE_NFCB: 4,
+    MODE_POLL | TECH_PASSIVE_NFCF: 8,
+}
+
+class TagInfo_t:
+    """
+    Compact record of an activated tag, decoded from RF_INTF_ACTIVATED_NTF.
+    
+    Filled by parse() in one pass over the notification, driven by the
+    TECH_PARAMS table, so the NFCID is found by the length fields of the
+    frame instead of guessed offsets and 4, 7 and 10 byte UIDs all work.
+    Buffers are allocated once and reused for every tag.
+    
+    Attributes:
+        ModeTech (int): Activation RF technology and mode
+        NfcId (bytearray): NFCID1, NFCID0, NFCID2 or ISO15693 UID
+        NfcIdLen (int): Valid bytes in NfcId, 0 if unknown
+        SensRes (bytearray): SENS_RES, SENSB_RES or SENSF_RES
+        SensResLen (int): Valid bytes in SensRes
+        SelRes (int): SEL_RES (SAK) for NFC-A, -1 if none
+        Rats (bytearray): RATS response (ATS) for NFC-A ISO-DEP, ATTRIB
+            response for NFC-B
+        RatsLen (int): Valid bytes in Rats
+    """
+    # Documents the fixed field set; MicroPython ignores __slots__
+    __slots__ = ('ModeTech', 'NfcId', 'NfcIdLen', 'SensRes', 'SensResLen', 'SelRes', 'Rats', 'RatsLen')
+    
+    def __init__(self):
+        self.ModeTech = 0
+        self.NfcId = bytearray(10)
+        self.NfcIdLen = 0
+        self.SensRes = bytearray(18)
+        self.SensResLen = 0
+        self.SelRes = -1
+        self.Rats = bytearray(20)
+        self.RatsLen = 0
+    
+    def parse(self, buf, length):
+        """
+        Decode an RF_INTF_ACTIVATED_NTF.
+        
+        Args:
+            buf (bytearray): The whole notification, header included
+            length (int): Valid bytes in buf
+        
+        Returns:
+            bool: False if the frame is truncated; fields decoded up to
+                that point are kept
+        """
+        self.NfcIdLen = self.SensResLen = self.RatsLen = 0
+        self.SelRes = -1
+        if length <= ACT_PARAMS:
+            return False
+        self.ModeTech = modeTech = buf[ACT_MODE_TECH]
+        view = memoryview(buf)
+        end = ACT_PARAMS + buf[ACT_PARAMS_LEN]
+        if end > length:
+            return False
+        
+        i = ACT_PARAMS
+        for field, size in TECH_PARAMS.get(modeTech, ()):
+            if not size:
+                if i >= end:
+                    return False
+                size = buf[i]
+                i += 1
+            if i + size > end:
+                return False
+            if field == FIELD_SENS_RES:
+                size = min(size, len(self.SensRes))
+                self.SensRes[:size] = view[i:i + size]
+                self.SensResLen = size
+            elif field == FIELD_NFCID:
+                size = min(size, len(self.NfcId))
+                self.NfcId[:size] = view[i:i + size]
+                self.NfcIdLen = size
+            elif field == FIELD_SEL_RES and size:
+                self.SelRes = buf[i]
+            i += size
+        
+        n = NFCID_IN_SENS_RES.get(modeTech, 0)
+        if n and self.SensResLen >= n:
+            self.NfcId[:n] = self.SensRes[:n]
+            self.NfcIdLen = n
+        
+        # Data exchange mode and bit rates (3 bytes), then the activation
+        # parameters: their length, and if any, the RATS/ATTRIB response length
+        i = end + 3
+        if i >= length:
+            return False
+        if not buf[i]:
+            return True
+        i += 2
+        if i > length:
+            return False
+        size = min(buf[i - 1], length - i, len(self.Rats))
+        self.Rats[:size] = view[i:i + size]
+        self.RatsLen = size
+        return True
+    
+    def uid(self):
+        """Return the NFCID as bytes, None if the tag has none."""
+        return bytes(self.NfcId[:self.NfcIdLen]) if self.NfcIdLen else None
+
 class RfIntf_t:
     """
     Main NCI RF Interface structure.
@@ -267,6 +502,7 @@ class RfIntf_t:
         ModeTech (int): Combined mode and technology identifier
         MoreTags (bool): True if more tags are available in field
         Info (RfIntf_Info_t): Technology-specific interface information
+        Tag (TagInfo_t): Decoded activation parameters of the tag
     """
     def __init__(self):
         self.Interface = 0             # NCI interface identifier
@@ -274,6 +510,106 @@ class RfIntf_t:
         self.ModeTech = 0              # Combined mode and technology
         self.MoreTags = False          # Multiple tags present flag
         self.Info = RfIntf_Info_t()    # Technology-specific information
+        self.Tag = TagInfo_t()         # Decoded activation parameters
+
+class NciFrame_t:
+    """
+    Buffer for one NCI frame with cached memoryviews.
+    
+    readData() reads the header and payload straight into `buf` with
+    I2C.readfrom_into(), and commands are assembled in place in a TX
+    frame and written through frame(). The views are created once per
+    length and reused, so sending or receiving a frame allocates nothing
+    once the usual frame lengths have been seen.
+    
+    Attributes:
+        buf (bytearray): Frame bytes, header first
+        header (memoryview): View of the 3 header bytes
+    """
+    def __init__(self):
+        self.buf = bytearray(MAX_NCI_FRAME_SIZE)
+        self._view = memoryview(self.buf)
+        self.header = self._view[:MsgHeaderSize]
+        self._spans = {}
+    
+    def span(self, start, end):
+        """Return a view of buf[start:end]."""
+        key = (start << 16) | end  # small int, no tuple allocated
+        view = self._spans.get(key)
+        if view is None:
+            view = self._view[start:end]
+            self._spans[key] = view
+        return view
+    
+    def payload(self, length):
+        """Return a view of the first `length` payload bytes."""
+        return self.span(MsgHeaderSize, MsgHeaderSize + length)
+    
+    def frame(self, length):
+        """Return a view of the first `length` bytes, header included."""
+        return self.span(0, length)
+
+class TraceBuffer:
+    """
+    Ring buffer trace sink.
+    
+    Keeps the last `slots` records in one preallocated bytearray; each
+    record stores its kind, the full frame length and up to `width` bytes
+    of the frame. Nothing is formatted when recording, records are only
+    turned into text by lines() or dump() when someone asks for them.
+    
+    Any object with a record(kind, data, length) method can be used as
+    a sink instead, see lib_PN7150.setTrace().
+    """
+    def __init__(self, slots=32, width=32):
+        self._slots = slots
+        self._width = width
+        self._buf = bytearray(slots * (width + 2))
+        self._next = 0
+        self._count = 0
+    
+    def record(self, kind, data, length):
+        """
+        Store a record, overwriting the oldest one when full.
+        
+        Args:
+            kind (int): TRACE_TX, TRACE_RX or TRACE_ERR
+            data (bytearray or memoryview): Frame bytes
+            length (int): Number of valid bytes in data
+        """
+        offset = self._next * (self._width + 2)
+        n = min(length, self._width)
+        self._buf[offset] = kind
+        self._buf[offset + 1] = min(length, 255)
+        self._buf[offset + 2:offset + 2 + n] = data[:n]
+        self._next = (self._next + 1) % self._slots
+        if self._count < self._slots:
+            self._count += 1
+    
+    def lines(self):
+        """Yield the stored records as text, oldest first."""
+        for i in range(self._count):
+            slot = (self._next - self._count + i) % self._slots
+            offset = slot * (self._width + 2)
+            kind = self._buf[offset]
+            length = self._buf[offset + 1]
+            data = self._buf[offset + 2:offset + 2 + min(length, self._width)]
+            more = '...' if length > self._width else ''
+            yield '%s %s%s' % (('TX', 'RX', 'ERR')[kind], binascii.hexlify(data, ' ').decode() or '-', more)
+    
+    def dump(self):
+        """Print the stored records, oldest first."""
+        for line in self.lines():
+            print(line)
+    
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+class TracePrinter:
+    """Trace sink that prints every record right away (slow, for the REPL)."""
+    def record(self, kind, data, length):
+        print('%s %s' % (('TX', 'RX', 'ERR')[kind], binascii.hexlify(data[:length], ' ').decode()))
 
 class lib_PN7150:
     """
@@ -307,9 +643,14 @@ class lib_PN7150:
         # Start read/write mode
         nfc.ConfigMode(1)  # RW mode
         nfc.StartDiscovery(1)
+        
+        # Keep the last NCI frames in RAM and print them when needed
+        trace = nfc.setTrace(TRACE_FRAMES)
+        trace.dump()
     """
     
-    def __init__(self, IRQpin=15, VENpin=14, SCLpin=22, SDApin=21, I2Caddress=0x28, wire=None):
+    def __init__(self, IRQpin=15, VENpin=14, SCLpin=22, SDApin=21, I2Caddress=0x28, wire=None, use_irq=True,
+                 i2c_freq=I2C_FREQ_STANDARD, burst=0):
         """
         Initialize PN7150 NFC Controller with complete hardware setup.
         
@@ -330,6 +671,15 @@ class lib_PN7150:
                 The PN7150's I2C address (usually 0x28 or 0x29)
             wire (I2C, optional): Existing I2C instance (default: None)
                 If provided, uses existing I2C instead of creating new one
+            use_irq (bool): Receive frames from an IRQ pin interrupt (default: True)
+                If False, getMessage() polls the IRQ pin like the Arduino library
+            i2c_freq (int): I2C clock in Hz (default: 100000)
+                Faster than 100 kHz is verified by a self-test at startup and
+                falls back to 100 kHz if the link is unreliable; ignored when
+                an existing I2C instance is passed in `wire`
+            burst (int): Payload bytes read together with the header (default: 0)
+                With burst > 0 frames up to that payload size are read in a
+                single I2C transaction instead of two; also self-tested
         
         Raises:
             Exception: If PN7150 initialization fails at any step
@@ -340,6 +690,12 @@ class lib_PN7150:
         self._SDApin = SDApin
         self._I2Caddress = I2Caddress
         self._wire = wire
+        self._ownWire = wire is None
+        self.i2cFreq = i2c_freq
+        self.burst = min(burst, MaxPayloadSize)
+        # what was asked for; reset() goes back to it after a fallback
+        self._i2cFreq = self.i2cFreq
+        self._burst = self.burst
         
         # Initialize pins
         self.irq = Pin(IRQpin, Pin.IN)
@@ -349,11 +705,42 @@ class lib_PN7150:
             self.ven = None
         
         # Message handling variables
-        self.rxBuffer = bytearray(MAX_NCI_FRAME_SIZE)
+        self._rxFrame = NciFrame_t()
+        self.rxBuffer = self._rxFrame.buf
+        self._txFrame = NciFrame_t()
         self.rxMessageLength = 0
         self.timeOutStartTime = 0
         self.timeOut = 0
         
+        # Frame queue filled from the IRQ handler; buffers are swapped with
+        # rxBuffer on delivery, so nothing is copied or allocated per frame
+        self._frames = [NciFrame_t() for _ in range(FRAME_QUEUE_SIZE)]
+        self._frameLengths = [0] * FRAME_QUEUE_SIZE
+        self._frameHead = 0
+        self._frameCount = 0
+        self._rxBusy = False
+        self._use_irq = use_irq
+        # bound method created once, the hard IRQ handler must not allocate
+        self._irqReadRef = self._irqRead
+        # wakes coroutines waiting in receive(); set from the scheduled reader
+        self._rxFlag = asyncio.ThreadSafeFlag() if use_irq else None
+        
+        # Tracing is off until setTrace() is called
+        self.traceLevel = TRACE_OFF
+        self.trace = None
+        
+        # EEPROM configuration, see ConfigureSettings()
+        self.configApplied = False
+        self._rfSettingsRestored = False
+        
+        # NCI error notifications seen, for health monitoring
+        self.errorCount = 0
+        self.lastError = 0
+        
+        # RF state machine, see _trackRfState()
+        self.rfState = RFST_IDLE
+        self._discoveryMode = 1
+        
         # Controller info
         self.gNfcController_generation = 0
         self.gNfcController_fw_version = bytearray(3)
@@ -381,8 +768,8 @@ class lib_PN7150:
         """
         try:
             # Step 1: Hardware initialization
-            if self._wire is None:
-                self._wire = I2C(0, scl=Pin(self._SCLpin), sda=Pin(self._SDApin), freq=100000)
+            if self._ownWire:
+                self._openBus()
             
             # Step 2: Power cycle the chip
             if self._VENpin != NO_PN7150_RESET_PIN:
@@ -393,8 +780,11 @@ class lib_PN7150:
                 self.ven.value(1)
                 time.sleep_ms(3)
             
-            # Step 3: Connect to NCI
-            if self.connectNCI() != SUCCESS:
+            if self._use_irq:
+                self.irq.irq(trigger=Pin.IRQ_RISING, handler=self._irqHandler)
+            
+            # Step 3: Connect to NCI, stepping down the link if it is unreliable
+            if self._connectLink() != SUCCESS:
                 raise Exception("Failed to connect to NCI")
             
             # Step 4: Configure settings
@@ -407,6 +797,48 @@ class lib_PN7150:
             print(f"PN7150 initialization failed: {e}")
             raise
     
+    async def reset(self, level=RESET_NCI):
+        """
+        Bring a misbehaving PN7150 back to a configured, idle state.
+        
+        Frames still queued are dropped. Discovery has to be configured and
+        started again afterwards (ConfigMode + start_discovery). Every wait
+        yields to the event loop, so a dead controller costs the other
+        tasks nothing but the I2C transfers.
+        
+        A link that fell back to a slower speed or to two-transaction reads
+        goes back to the configured one first; the self-test after
+        connecting steps it down again only if the bus is still unreliable.
+        
+        Args:
+            level (int): RESET_NCI, RESET_VEN or RESET_FULL
+        
+        Returns:
+            int: SUCCESS (0) if the controller answered and was configured
+        """
+        self._frameHead = 0
+        self._frameCount = 0
+        self.rfState = RFST_IDLE
+        try:
+            self.burst = self._burst
+            if self._ownWire and (level >= RESET_FULL or self.i2cFreq != self._i2cFreq):
+                self.i2cFreq = self._i2cFreq
+                self._openBus()
+            if level >= RESET_VEN and self._VENpin != NO_PN7150_RESET_PIN:
+                self.ven.value(0)
+                await asyncio.sleep_ms(1)
+                self.ven.value(1)
+                await asyncio.sleep_ms(3)
+            if level >= RESET_FULL and self._use_irq:
+                self.irq.irq(trigger=Pin.IRQ_RISING, handler=self._irqHandler)
+            if await self._connect_link() != SUCCESS or await self.configure():
+                return ERROR
+        except Exception as e:
+            # I2C errors on a wedged bus
+            print(f"PN7150 reset failed: {e}")
+            return ERROR
+        return SUCCESS
+    
     def begin(self):
         """
         Legacy hardware initialization method (for compatibility).
@@ -423,7 +855,8 @@ class lib_PN7150:
         """
         if self._wire is None:
             # Initialize I2C if not provided
-            self._wire = I2C(0, scl=Pin(self._SCLpin), sda=Pin(self._SDApin), freq=100000)
+            self._ownWire = True
+            self._openBus()
         
         if self._VENpin != NO_PN7150_RESET_PIN:
             self.ven.value(1)
@@ -435,6 +868,90 @@ class lib_PN7150:
         
         return SUCCESS
     
+    def _openBus(self):
+        """(Re)create the I2C bus at self.i2cFreq."""
+        self._wire = I2C(0, scl=Pin(self._SCLpin), sda=Pin(self._SDApin), freq=self.i2cFreq)
+    
+    def _checkLink(self):
+        """
+        Self-test the I2C link at the current speed and read strategy.
+        
+        Repeats CORE_GET_CONFIG(TOTAL_DURATION) and checks that every
+        response is well formed and identical. Skipped at 100 kHz with
+        two-transaction reads, the configuration the library always used.
+        
+        Returns:
+            bool: True if the link can be trusted
+        """
+        if self.i2cFreq <= I2C_FREQ_STANDARD and not self.burst:
+            return True
+        expected = None
+        for _ in range(I2C_SELFTEST_ROUNDS):
+            self.writeData(NCI_CORE_GET_TOTAL_DURATION, len(NCI_CORE_GET_TOTAL_DURATION))
+            expected = self._selfTestFrame(self.getMessage(50), expected)
+            if expected is None:
+                return False
+        return True
+    
+    def _selfTestFrame(self, length, expected):
+        """
+        Check one self-test response in rxBuffer.
+        
+        Returns:
+            bytes or None: The response, None if it is malformed or differs
+                from the expected one
+        """
+        rx = self.rxBuffer
+        if length < 4 or length != MsgHeaderSize + rx[2] or rx[0] != 0x40 or rx[1] != 0x03 or rx[3] != 0x00:
+            return None
+        if expected is None:
+            return bytes(rx[:length])
+        return expected if rx[:length] == expected else None
+    
+    def _connectLink(self):
+        """
+        Connect to NCI and self-test the link, stepping it down as needed.
+        
+        Only a controller that answers with malformed frames, or fails the
+        self-test, is a reason to slow the link down. One that does not
+        answer at all would fail the same way at 100 kHz, so it leaves the
+        link as it is.
+        
+        Returns:
+            int: SUCCESS (0) once connected over a link that passed the self-test
+        """
+        while True:
+            if self.connectNCI() == SUCCESS:
+                if self._checkLink():
+                    return SUCCESS
+            elif not self.rxMessageLength:
+                return ERROR
+            if not self._slowDown():
+                return ERROR
+            # drop whatever a garbled exchange left behind
+            while self.getMessage(5):
+                pass
+    
+    def _slowDown(self):
+        """
+        Step back to a more conservative link after a proven bus error.
+        
+        Burst reads are dropped first, then the bus goes back to 100 kHz.
+        
+        Returns:
+            bool: False if there is nothing left to fall back to
+        """
+        if self.burst:
+            print("PN7150: burst reads failed self-test, disabled")
+            self.burst = 0
+        elif self.i2cFreq > I2C_FREQ_STANDARD and self._ownWire:
+            print(f"PN7150: I2C unreliable at {self.i2cFreq} Hz, using {I2C_FREQ_STANDARD}")
+            self.i2cFreq = I2C_FREQ_STANDARD
+            self._openBus()
+        else:
+            return False
+        return True
+    
     def hasMessage(self):
         """
         Check if PN7150 has data available for reading.
@@ -462,13 +979,49 @@ class lib_PN7150:
         Returns:
             int: 0 on success, 4 on I2C write error
         """
+        if txBufferLevel != len(txBuffer):
+            txBuffer = memoryview(txBuffer)[:txBufferLevel]
+        if self.traceLevel >= TRACE_FRAMES:
+            self.trace.record(TRACE_TX, txBuffer, txBufferLevel)
         try:
-            self._wire.writeto(self._I2Caddress, txBuffer[:txBufferLevel])
+            self._wire.writeto(self._I2Caddress, txBuffer)
             return 0  # SUCCESS
         except Exception as e:
             print(f"Write error: {e}")
             return 4  # Could not properly copy data to I2C buffer
     
+    def _writeSelect(self, protocol):
+        """Send RF_DISCOVER_SELECT_CMD for the first discovered tag."""
+        if protocol == PROT_ISODEP:
+            interface = INTF_ISODEP
+        elif protocol == PROT_NFCDEP:
+            interface = INTF_NFCDEP
+        elif protocol == PROT_MIFARE:
+            interface = INTF_TAGCMD
+        else:
+            interface = INTF_FRAME
+        tx = self._txFrame
+        tx.buf[:6] = NCI_RF_DISCOVER_SELECT
+        tx.buf[4] = protocol
+        tx.buf[5] = interface
+        return self.writeData(tx.frame(6), 6)
+    
+    def _writeDataPacket(self, payload):
+        """
+        Send payload as a DATA_PACKET on the static RF connection.
+        
+        Returns:
+            memoryview: The packet as sent, valid until the next command
+        """
+        tx = self._txFrame
+        length = len(payload)
+        tx.header[:] = NCI_DATA_HEADER
+        tx.buf[2] = length
+        tx.payload(length)[:] = payload
+        packet = tx.frame(MsgHeaderSize + length)
+        self.writeData(packet, len(packet))
+        return packet
+    
     def readData(self, rxBuffer):
         """
         Read data from PN7150 via I2C communication.
@@ -478,34 +1031,126 @@ class lib_PN7150:
         The header contains the payload length information.
         
         Args:
-            rxBuffer (bytearray): Buffer to store received data
+            rxBuffer (bytearray or NciFrame_t): Buffer to store received data
         
         Returns:
             int: Number of bytes received, 0 if no data available
         """
-        bytesReceived = 0
+        if not self.hasMessage():  # only try to read something if the PN7150 indicates it has something
+            return 0
         
-        if self.hasMessage():  # only try to read something if the PN7150 indicates it has something
+        if rxBuffer is self.rxBuffer:
+            frame = self._rxFrame
+        elif isinstance(rxBuffer, NciFrame_t):
+            frame = rxBuffer
+        else:
+            return self._readInto(rxBuffer)
+        
+        burst = self.burst
+        if burst:
+            # header and the first `burst` payload bytes in one transaction,
+            # so short frames cost a single bus transaction
+            self._wire.readfrom_into(self._I2Caddress, frame.frame(MsgHeaderSize + burst))
+            payloadLength = frame.buf[2]
+            if payloadLength > burst:
+                self._wire.readfrom_into(self._I2Caddress,
+                                         frame.span(MsgHeaderSize + burst, MsgHeaderSize + payloadLength))
+        else:
             # first reading the header, as this contains how long the payload will be
-            bytesReceived = self._wire.readfrom(self._I2Caddress, 3)
-            
-            if len(bytesReceived) == 3:
-                rxBuffer[0] = bytesReceived[0]
-                rxBuffer[1] = bytesReceived[1]
-                rxBuffer[2] = bytesReceived[2]
-                
-                payloadLength = rxBuffer[2]
-                if payloadLength > 0:
-                    # then reading the payload, if any
-                    payload = self._wire.readfrom(self._I2Caddress, payloadLength)
-                    index = 3
-                    for i in range(len(payload)):
-                        if index < len(rxBuffer):
-                            rxBuffer[index] = payload[i]
-                            index += 1
-                    bytesReceived = index
-        
-        return bytesReceived
+            self._wire.readfrom_into(self._I2Caddress, frame.header)
+            payloadLength = frame.buf[2]
+            if payloadLength > 0:
+                # then reading the payload straight behind it
+                self._wire.readfrom_into(self._I2Caddress, frame.payload(payloadLength))
+        if self.traceLevel >= TRACE_FRAMES:
+            self.trace.record(TRACE_RX, frame.buf, MsgHeaderSize + payloadLength)
+        return MsgHeaderSize + payloadLength
+    
+    def setTrace(self, level, sink=None):
+        """
+        Enable or disable tracing of NCI traffic.
+        
+        Args:
+            level (int): TRACE_OFF, TRACE_ERRORS or TRACE_FRAMES
+            sink (object, optional): Object with a record(kind, data, length)
+                method; defaults to a TraceBuffer, kept across calls
+        
+        Returns:
+            object: The active sink, e.g. call .dump() on a TraceBuffer
+        """
+        if sink is not None:
+            self.trace = sink
+        elif self.trace is None and level > TRACE_OFF:
+            self.trace = TraceBuffer()
+        self.traceLevel = level
+        return self.trace
+    
+    def _traceError(self):
+        """Record the frame in rxBuffer as the cause of a failed exchange."""
+        if self.traceLevel >= TRACE_ERRORS:
+            self.trace.record(TRACE_ERR, self.rxBuffer, self.rxMessageLength)
+    
+    def _readInto(self, rxBuffer):
+        """readData() into a caller-provided bytearray (allocates views)."""
+        view = memoryview(rxBuffer)
+        self._wire.readfrom_into(self._I2Caddress, view[:MsgHeaderSize])
+        payloadLength = min(rxBuffer[2], len(rxBuffer) - MsgHeaderSize)
+        if payloadLength > 0:
+            self._wire.readfrom_into(self._I2Caddress, view[MsgHeaderSize:MsgHeaderSize + payloadLength])
+        return MsgHeaderSize + payloadLength
+    
+    def _irqHandler(self, pin):
+        """
+        IRQ pin rising-edge handler.
+        
+        Runs in interrupt context, so it only schedules _irqRead() to do
+        the I2C transfer as soon as the interpreter is at a safe point.
+        """
+        try:
+            micropython.schedule(self._irqReadRef, 0)
+        except RuntimeError:
+            pass  # schedule queue full; getMessage() reads the pending frame itself
+    
+    def _irqRead(self, _):
+        """
+        Drain pending frames from the PN7150 into the frame queue.
+        
+        The IRQ line stays HIGH while more frames are pending, so this keeps
+        reading until it drops or the queue is full.
+        """
+        if self._rxBusy:
+            return
+        self._rxBusy = True
+        try:
+            while self._frameCount < FRAME_QUEUE_SIZE and self.hasMessage():
+                tail = (self._frameHead + self._frameCount) % FRAME_QUEUE_SIZE
+                length = self.readData(self._frames[tail])
+                if not length:
+                    break
+                self._frameLengths[tail] = length
+                self._frameCount += 1
+        finally:
+            self._rxBusy = False
+        if self._frameCount:
+            self._rxFlag.set()
+    
+    def _takeFrame(self):
+        """
+        Move the oldest queued frame into rxBuffer.
+        
+        Returns:
+            int: Length of the frame, 0 if the queue is empty
+        """
+        if not self._frameCount:
+            return 0
+        head = self._frameHead
+        # swap buffers instead of copying the frame
+        self._rxFrame, self._frames[head] = self._frames[head], self._rxFrame
+        self.rxBuffer = self._rxFrame.buf
+        length = self._frameLengths[head]
+        self._frameHead = (head + 1) % FRAME_QUEUE_SIZE
+        self._frameCount -= 1
+        return length
     
     def isTimeOut(self):
         """
@@ -539,6 +1184,10 @@ class lib_PN7150:
         Waits for the PN7150 to indicate data is available and then reads
         the complete NCI message. Uses timeout to prevent infinite waiting.
         
+        With IRQ reception enabled the frames are read by the interrupt
+        path and this only waits on the frame queue, sleeping in 1 ms steps
+        so the CPU idles instead of hammering the IRQ pin.
+        
         Args:
             timeout (int): Timeout duration in milliseconds (default: 5)
                 Special value 1337 means infinite timeout (continuous polling)
@@ -546,25 +1195,413 @@ class lib_PN7150:
         Returns:
             int: Number of bytes received, 0 if timeout occurred
         """
+        start = time.ticks_us()
         self.setTimeOut(timeout)
         self.rxMessageLength = 0
         
-        while not self.isTimeOut():
-            self.rxMessageLength = self.readData(self.rxBuffer)
+        if not self._use_irq:
+            while not self.isTimeOut():
+                self.rxMessageLength = self.readData(self.rxBuffer)
+                if self.rxMessageLength:
+                    self._trackRfState()
+                    break
+                elif timeout == 1337:
+                    self.setTimeOut(timeout)
+            self._countWait(start)
+            return self.rxMessageLength
+        
+        while True:
+            self.rxMessageLength = self._takeFrame()
             if self.rxMessageLength:
+                self._trackRfState()
                 break
-            elif timeout == 1337:
+            if self.hasMessage():
+                # edge missed (queue was full or line already HIGH)
+                self._irqRead(0)
+                continue
+            if self.isTimeOut():
+                if timeout != 1337:
+                    break
                 self.setTimeOut(timeout)
+            time.sleep_ms(1)
         
+        self._countWait(start)
         return self.rxMessageLength
     
+    def _countWait(self, start):
+        """Record a getMessage() wait that began at start (ticks_us)."""
+        if metrics:
+            _syncWaits.since(start)
+            if not self.rxMessageLength:
+                _timeouts.inc()
+    
+    def _trackRfState(self):
+        """
+        Update rfState from the frame just received into rxBuffer.
+        
+        Follows the RFST_* transitions of the NCI RF state machine so
+        callers can tell whether discovery is running without asking the
+        controller. Only a few header bytes are compared per frame.
+        """
+        if metrics:
+            _frames.inc()
+        rx = self.rxBuffer
+        if rx[0] == 0x61:
+            if rx[1] == 0x05:
+                # RF_INTF_ACTIVATED_NTF
+                self.rfState = RFST_LISTEN_ACTIVE if rx[6] & MODE_LISTEN else RFST_POLL_ACTIVE
+            elif rx[1] == 0x03:
+                # RF_DISCOVER_NTF, last byte tells whether more follow
+                last = rx[self.rxMessageLength - 1]
+                self.rfState = RFST_W4_ALL_DISCOVERIES if last == 0x02 else RFST_W4_HOST_SELECT
+            elif rx[1] == 0x06:
+                # RF_DEACTIVATE_NTF
+                kind = rx[3]
+                if kind == DEACTIVATE_DISCOVERY:
+                    self.rfState = RFST_DISCOVERY
+                elif kind == DEACTIVATE_IDLE:
+                    self.rfState = RFST_IDLE
+                elif self.rfState == RFST_LISTEN_ACTIVE:
+                    self.rfState = RFST_LISTEN_SLEEP
+                else:
+                    self.rfState = RFST_W4_HOST_SELECT
+        elif rx[0] == 0x41 and rx[3] == 0x00:
+            if rx[1] == 0x03:
+                # RF_DISCOVER_RSP
+                self.rfState = RFST_DISCOVERY
+            elif rx[1] == 0x06 and self.rfState == RFST_DISCOVERY:
+                # RF_DEACTIVATE_RSP; from discovery no NTF follows
+                self.rfState = RFST_IDLE
+        elif rx[0] == 0x40 and rx[1] == 0x00:
+            # CORE_RESET_RSP
+            self.rfState = RFST_IDLE
+        elif rx[0] == 0x60 and (rx[1] == 0x07 or rx[1] == 0x08):
+            # CORE_GENERIC_ERROR_NTF / CORE_INTERFACE_ERROR_NTF
+            self.errorCount += 1
+            self.lastError = rx[3]
+    
+    # =========================================================================
+    # ASYNC API
+    # =========================================================================
+    #
+    # Awaitable counterparts of getMessage(), WaitForDiscoveryNotification(),
+    # SendApduCommand(), Start/StopDiscovery(), connectNCI() and
+    # ConfigureSettings(), plus reset(). They never block the event
+    # loop while waiting for the PN7150: with IRQ reception they sleep on the
+    # frame queue flag, otherwise they poll the IRQ pin every millisecond and
+    # yield in between. Only the I2C transfers themselves are synchronous.
+    
+    async def receive(self, timeout=5):
+        """
+        Wait for and receive a message from PN7150 without blocking the loop.
+        
+        Args:
+            timeout (int or None): Timeout in milliseconds, None waits forever
+        
+        Returns:
+            int: Number of bytes received into rxBuffer, 0 if timeout occurred
+        """
+        if timeout is not None:
+            deadline = time.ticks_add(time.ticks_ms(), timeout)
+        while True:
+            if self._use_irq:
+                length = self._takeFrame()
+            else:
+                length = self.readData(self.rxBuffer)
+            if length:
+                self.rxMessageLength = length
+                self._trackRfState()
+                return length
+            if self._use_irq and self.hasMessage():
+                # edge missed (queue was full or line already HIGH)
+                self._irqRead(0)
+                continue
+            
+            remaining = 1 if timeout is None else time.ticks_diff(deadline, time.ticks_ms())
+            if remaining <= 0:
+                self.rxMessageLength = 0
+                return 0
+            if not self._use_irq:
+                await asyncio.sleep_ms(1)
+            elif timeout is None:
+                await self._rxFlag.wait()
+            else:
+                try:
+                    await asyncio.wait_for_ms(self._rxFlag.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+    
+    async def wait_for_tag(self, pRfIntf, timeout=None):
+        """
+        Wait for a tag to be discovered and activated.
+        
+        Async counterpart of WaitForDiscoveryNotification(). Unlike the
+        blocking version it reports a timeout as False instead of parsing
+        whatever frame was left in rxBuffer, and after selecting one of
+        several tags it waits for that tag's activation before returning.
+        
+        Args:
+            pRfIntf (RfIntf_t): Interface structure to populate with tag info
+            timeout (int or None): Timeout in milliseconds, None waits forever
+        
+        Returns:
+            bool: True if a tag was activated, False otherwise
+        """
+        global gNextTag_Protocol
+        gNextTag_Protocol = PROT_UNDETERMINED
+        
+        while True:
+            if not await self.receive(timeout):
+                return False
+            if self.rxBuffer[0] == 0x61 and self.rxBuffer[1] in (0x03, 0x05):
+                break
+        
+        if self.rxBuffer[1] == 0x05:
+            # RF_INTF_ACTIVATED_NTF
+            self._fillActivation(pRfIntf)
+            return True
+        
+        # RF_DISCOVER_NTF: several tags in the field, select the first one
+        pRfIntf.Interface = INTF_UNDETERMINED
+        pRfIntf.Protocol = self.rxBuffer[4]
+        pRfIntf.ModeTech = self.rxBuffer[5]
+        pRfIntf.MoreTags = True
+        
+        while self.rxBuffer[self.rxMessageLength - 1] == 0x02:
+            # more RF_DISCOVER_NTFs follow
+            if not await self.receive(100):
+                return False
+            if self.rxBuffer[0] == 0x61 and self.rxBuffer[1] == 0x03:
+                gNextTag_Protocol = self.rxBuffer[4]
+        
+        self._writeSelect(pRfIntf.Protocol)
+        
+        while await self.receive(100):
+            if self.rxBuffer[0] == 0x41 and self.rxBuffer[1] == 0x04:
+                if self.rxBuffer[3] != 0x00:
+                    return False
+            elif self.rxBuffer[0] == 0x61 and self.rxBuffer[1] == 0x05:
+                self._fillActivation(pRfIntf)
+                pRfIntf.MoreTags = True
+                return True
+        return False
+    
+    def _fillActivation(self, pRfIntf):
+        """Fill pRfIntf from the RF_INTF_ACTIVATED_NTF in rxBuffer."""
+        pRfIntf.Interface = self.rxBuffer[4]
+        pRfIntf.Protocol = self.rxBuffer[5]
+        pRfIntf.ModeTech = self.rxBuffer[6]
+        pRfIntf.MoreTags = False
+        self.FillInterfaceInfo(pRfIntf)
+    
+    async def transceive(self, apdu, timeout=1000):
+        """
+        Exchange an APDU with an activated ISO-DEP tag.
+        
+        Async counterpart of SendApduCommand(). Credit notifications the
+        PN7150 sends around the exchange are skipped.
+        
+        Args:
+            apdu (bytes or bytearray): APDU command bytes
+            timeout (int): Timeout for the response in milliseconds
+        
+        Returns:
+            bytes or None: APDU response from the tag, None on timeout or error
+        """
+        self._writeDataPacket(apdu)
+        
+        deadline = time.ticks_add(time.ticks_ms(), timeout)
+        while True:
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+            if remaining <= 0 or not await self.receive(remaining):
+                self._traceError()
+                return None
+            if self.rxBuffer[0] == 0x00 and self.rxBuffer[1] == 0x00:
+                # DATA_PACKET on the static RF connection
+                length = self.rxBuffer[2]
+                if length:
+                    return bytes(self.rxBuffer[3:3 + length])
+                self._traceError()
+                return None
+            if self.rxBuffer[0] == 0x61 and self.rxBuffer[1] == 0x06:
+                # RF_DEACTIVATE_NTF, the tag left the field
+                self._traceError()
+                return None
+    
+    async def start_discovery(self, modeSE):
+        """
+        Async counterpart of StartDiscovery().
+        
+        Args:
+            modeSE (int): Operating mode for discovery (see StartDiscovery)
+        
+        Returns:
+            int: SUCCESS (0) on success, ERROR (1) on failure
+        """
+        self._discoveryMode = modeSE
+        cmd = self._discoverCmd(modeSE)
+        self.writeData(cmd, len(cmd))
+        while await self.receive(100):
+            if self.rxBuffer[0] == 0x41 and self.rxBuffer[1] == 0x03:
+                return SUCCESS if self.rxBuffer[3] == 0x00 else ERROR
+        return ERROR
+    
+    async def stop_discovery(self):
+        """
+        Async counterpart of StopDiscovery().
+        
+        Waits for the RF_DEACTIVATE_RSP and, only when the RF state was
+        not RFST_DISCOVERY, the RF_DEACTIVATE_NTF that follows it.
+        
+        Returns:
+            bool: True if the controller is back in RFST_IDLE
+        """
+        self.writeData(NCI_RF_DEACTIVATE_IDLE, len(NCI_RF_DEACTIVATE_IDLE))
+        while await self.receive(100):
+            if self.rxBuffer[0] == 0x41 and self.rxBuffer[1] == 0x06:
+                break
+        while self.rfState != RFST_IDLE and await self.receive(100):
+            pass
+        return self.rfState == RFST_IDLE
+    
+    async def probe(self, timeout=100):
+        """
+        Check that the controller still answers commands.
+        
+        Sends CORE_GET_CONFIG, which is allowed in every RF state and has
+        no side effects. Frames that arrive meanwhile are consumed.
+        
+        Args:
+            timeout (int): Time to wait for the response in milliseconds
+        
+        Returns:
+            bool: True if the response arrived in time
+        """
+        self.writeData(NCI_CORE_GET_TOTAL_DURATION, len(NCI_CORE_GET_TOTAL_DURATION))
+        while await self.receive(timeout):
+            if self.rxBuffer[0] == 0x40 and self.rxBuffer[1] == 0x03:
+                return True
+        return False
+    
+    async def restart_discovery(self):
+        """
+        Go back to discovery after a tag was handled.
+        
+        From an active tag this sends RF_DEACTIVATE_CMD with type discovery,
+        so the controller resumes polling right away without the idle round
+        trip of stop_discovery() + start_discovery(). States that only
+        allow deactivating to idle go through idle, and a controller that
+        is already in RFST_DISCOVERY is left alone.
+        
+        Returns:
+            int: SUCCESS (0) if discovery is running, ERROR (1) otherwise
+        """
+        state = self.rfState
+        if state == RFST_DISCOVERY:
+            return SUCCESS
+        if state in (RFST_POLL_ACTIVE, RFST_LISTEN_ACTIVE, RFST_LISTEN_SLEEP):
+            self.writeData(NCI_RF_DEACTIVATE_DISCOVERY, len(NCI_RF_DEACTIVATE_DISCOVERY))
+            while self.rfState != RFST_DISCOVERY and await self.receive(100):
+                if self.rxBuffer[0] == 0x41 and self.rxBuffer[1] == 0x06 and self.rxBuffer[3] != 0x00:
+                    break  # rejected, fall back to idle and restart
+            if self.rfState == RFST_DISCOVERY:
+                return SUCCESS
+        await self.stop_discovery()
+        return await self.start_discovery(self._discoveryMode)
+    
+    async def _wakeup(self):
+        """Async counterpart of wakeupNCI()."""
+        self.writeData(NCI_CORE_RESET, len(NCI_CORE_RESET))
+        if not await self.receive(15) or self.rxBuffer[0] != 0x40 or self.rxBuffer[1] != 0x00:
+            return ERROR
+        await self.receive()
+        return self._checkResetNtf()
+    
+    async def connect(self):
+        """
+        Async counterpart of connectNCI().
+        
+        Returns:
+            int: SUCCESS (0) once CORE_RESET and CORE_INIT were answered
+        """
+        start = time.ticks_ms()
+        while await self._wakeup() != SUCCESS:
+            if time.ticks_diff(time.ticks_ms(), start) >= NCI_CONNECT_TIMEOUT_MS:
+                return ERROR
+            await asyncio.sleep_ms(NCI_CONNECT_RETRY_MS)
+        
+        self.writeData(NCI_CORE_INIT, len(NCI_CORE_INIT))
+        await self.receive()
+        return self._checkInit()
+    
+    async def _check_link(self):
+        """Async counterpart of _checkLink()."""
+        if self.i2cFreq <= I2C_FREQ_STANDARD and not self.burst:
+            return True
+        expected = None
+        for _ in range(I2C_SELFTEST_ROUNDS):
+            self.writeData(NCI_CORE_GET_TOTAL_DURATION, len(NCI_CORE_GET_TOTAL_DURATION))
+            expected = self._selfTestFrame(await self.receive(50), expected)
+            if expected is None:
+                return False
+        return True
+    
+    async def _connect_link(self):
+        """Async counterpart of _connectLink()."""
+        while True:
+            if await self.connect() == SUCCESS:
+                if await self._check_link():
+                    return SUCCESS
+            elif not self.rxMessageLength:
+                return ERROR
+            if not self._slowDown():
+                return ERROR
+            while await self.receive(5):
+                pass
+    
+    async def configure(self):
+        """
+        Async counterpart of ConfigureSettings().
+        
+        Returns:
+            bool: False on success, True on error
+        """
+        if (await self._apply_config(NxpNci_CORE_CONF, 0x40) or
+                await self._apply_config(NxpNci_CORE_CONF_EXTN, 0x40) or
+                await self._apply_config(NxpNci_CORE_STANDBY, 0x4F)):
+            return True  # Error
+        
+        fingerprint = self._configFingerprint()
+        if not self._rfSettingsRestored and await self._read_fingerprint() == fingerprint:
+            self.configApplied = False
+            return False  # Success, nothing changed
+        
+        if (await self._apply_config(NxpNci_CLK_CONF, 0x40) or
+                await self._apply_config(NxpNci_TVDD_CONF_2ndGen, 0x40) or
+                await self._apply_config(NxpNci_RF_CONF_2ndGen, 0x40) or
+                await self._apply_config(self._fingerprintFrame(fingerprint), 0x40)):
+            return True  # Error
+        self._rfSettingsRestored = False
+        self.configApplied = True
+        return False  # Success
+    
+    async def _apply_config(self, block, rspGid):
+        """Async counterpart of _applyConfig()."""
+        self.writeData(block, len(block))
+        await self.receive(1000)
+        return self._configRejected(block, rspGid)
+    
+    async def _read_fingerprint(self):
+        """Async counterpart of _readFingerprint()."""
+        self.writeData(NCI_GET_FINGERPRINT, len(NCI_GET_FINGERPRINT))
+        return self._storedFingerprint(await self.receive(100))
+    
     def wakeupNCI(self):
         """EXACT translation of Arduino wakeupNCI() method"""
-        NCICoreReset = bytearray([0x20, 0x00, 0x01, 0x01])
         NbBytes = 0
         
         # Reset RF settings restauration flag
-        self.writeData(NCICoreReset, 4)
+        self.writeData(NCI_CORE_RESET, len(NCI_CORE_RESET))
         self.getMessage(15)
         NbBytes = self.rxMessageLength
         
@@ -572,13 +1609,16 @@ class lib_PN7150:
             return ERROR
         
         self.getMessage()
-        NbBytes = self.rxMessageLength
-        
-        if NbBytes != 0:
+        return self._checkResetNtf()
+    
+    def _checkResetNtf(self):
+        """Check what followed CORE_RESET_RSP; SUCCESS if nothing or anti-tearing."""
+        if self.rxMessageLength != 0:
             # Is CORE_GENERIC_ERROR_NTF ?
             if (self.rxBuffer[0] == 0x60) and (self.rxBuffer[1] == 0x07):
                 # Is PN7150B0HN/C11004 Anti-tearing recovery procedure triggered ?
-                pass  # gRfSettingsRestored_flag = true;
+                # RF settings were restored to defaults, so they must be rewritten
+                self._rfSettingsRestored = True
             else:
                 return ERROR
         
@@ -586,19 +1626,20 @@ class lib_PN7150:
     
     def connectNCI(self):
         """EXACT translation of Arduino connectNCI() method"""
-        i = 2
-        NCICoreInit = bytearray([0x20, 0x01, 0x00])
-        
-        # Loop until NXPNCI answers
+        # Loop until NXPNCI answers; the chip boots in a few ms after VEN,
+        # so retry often instead of sleeping 500 ms between attempts
+        start = time.ticks_ms()
         while self.wakeupNCI() != SUCCESS:
-            if i == 0:
+            if time.ticks_diff(time.ticks_ms(), start) >= NCI_CONNECT_TIMEOUT_MS:
                 return ERROR
-            i -= 1
-            time.sleep_ms(500)
+            time.sleep_ms(NCI_CONNECT_RETRY_MS)
         
-        self.writeData(NCICoreInit, len(NCICoreInit))
+        self.writeData(NCI_CORE_INIT, len(NCI_CORE_INIT))
         self.getMessage()
-        
+        return self._checkInit()
+    
+    def _checkInit(self):
+        """Check CORE_INIT_RSP and record the controller generation and FW version."""
         if (self.rxBuffer[0] != 0x40) or (self.rxBuffer[1] != 0x01) or (self.rxBuffer[3] != 0x00):
             return ERROR
         
@@ -627,6 +1668,11 @@ class lib_PN7150:
         - Voltage (TVDD) configuration
         - RF configuration (comprehensive RF tuning)
         
+        The clock, TVDD and RF blocks are stored in the PN7150 EEPROM. A
+        fingerprint of them is kept in the NXP config ID parameter (A0 14)
+        and read back first; if it matches, those writes are skipped and
+        configApplied stays False.
+        
         Args:
             uidcf (bytearray, optional): UID configuration (unused in this implementation)
             uidlen (int, optional): UID length (unused in this implementation)
@@ -634,43 +1680,82 @@ class lib_PN7150:
         Returns:
             bool: False on success, True on error
         """
-        # Apply CORE configuration
-        self.writeData(NxpNci_CORE_CONF, len(NxpNci_CORE_CONF))
-        self.getMessage(1000)
-        if (self.rxMessageLength == 0) or (self.rxBuffer[0] != 0x40) or (self.rxBuffer[1] != 0x02):
+        # Core settings, applied on every start like the NXP reference library
+        if (self._applyConfig(NxpNci_CORE_CONF, 0x40) or
+                self._applyConfig(NxpNci_CORE_CONF_EXTN, 0x40) or
+                self._applyConfig(NxpNci_CORE_STANDBY, 0x4F)):
             return True  # Error
         
-        # Apply CORE extension configuration
-        self.writeData(NxpNci_CORE_CONF_EXTN, len(NxpNci_CORE_CONF_EXTN))
-        self.getMessage(1000)
-        if (self.rxMessageLength == 0) or (self.rxBuffer[0] != 0x40) or (self.rxBuffer[1] != 0x02):
-            return True  # Error
-        
-        # Apply CORE standby configuration
-        self.writeData(NxpNci_CORE_STANDBY, len(NxpNci_CORE_STANDBY))
-        self.getMessage(1000)
-        if (self.rxMessageLength == 0) or (self.rxBuffer[0] != 0x4F) or (self.rxBuffer[1] != 0x00):
+        # Clock, TVDD and RF settings live in the PN7150 EEPROM. Their
+        # fingerprint is stored next to them, so when it matches (warm
+        # restart, reader recovery) the writes are skipped entirely
+        fingerprint = self._configFingerprint()
+        if not self._rfSettingsRestored and self._readFingerprint() == fingerprint:
+            self.configApplied = False
+            return False  # Success, nothing changed
+        
+        if (self._applyConfig(NxpNci_CLK_CONF, 0x40) or
+                self._applyConfig(NxpNci_TVDD_CONF_2ndGen, 0x40) or
+                self._applyConfig(NxpNci_RF_CONF_2ndGen, 0x40)):
             return True  # Error
         
-        # Apply Clock configuration
-        self.writeData(NxpNci_CLK_CONF, len(NxpNci_CLK_CONF))
-        self.getMessage(1000)
-        if (self.rxMessageLength == 0) or (self.rxBuffer[0] != 0x40) or (self.rxBuffer[1] != 0x02):
+        # Record what was applied, only once everything succeeded
+        if self._applyConfig(self._fingerprintFrame(fingerprint), 0x40):
             return True  # Error
+        self._rfSettingsRestored = False
+        self.configApplied = True
         
-        # Apply TVDD configuration
-        self.writeData(NxpNci_TVDD_CONF_2ndGen, len(NxpNci_TVDD_CONF_2ndGen))
-        self.getMessage(1000)
-        if (self.rxMessageLength == 0) or (self.rxBuffer[0] != 0x40) or (self.rxBuffer[1] != 0x02):
-            return True  # Error
+        return False  # Success
+    
+    def _applyConfig(self, block, rspGid):
+        """
+        Write one configuration block and check its response.
         
-        # Apply RF configuration
-        self.writeData(NxpNci_RF_CONF_2ndGen, len(NxpNci_RF_CONF_2ndGen))
+        Returns:
+            bool: False on success, True on error (no response, or a
+                status other than STATUS_OK)
+        """
+        self.writeData(block, len(block))
         self.getMessage(1000)
-        if (self.rxMessageLength == 0) or (self.rxBuffer[0] != 0x40) or (self.rxBuffer[1] != 0x02):
-            return True  # Error
+        return self._configRejected(block, rspGid)
+    
+    def _configRejected(self, block, rspGid):
+        """True unless rxBuffer holds block's response with STATUS_OK."""
+        return (self.rxMessageLength < 4 or self.rxBuffer[0] != rspGid or self.rxBuffer[1] != block[1]
+                or self.rxBuffer[3] != 0x00)
+    
+    def _fingerprintFrame(self, fingerprint):
+        """CORE_SET_CONFIG_CMD storing fingerprint, built in the TX frame."""
+        tx = self._txFrame
+        tx.buf[:len(NCI_SET_FINGERPRINT)] = NCI_SET_FINGERPRINT
+        tx.buf[len(NCI_SET_FINGERPRINT):len(NCI_SET_FINGERPRINT) + CONFIG_FINGERPRINT_SIZE] = fingerprint
+        return tx.frame(len(NCI_SET_FINGERPRINT) + CONFIG_FINGERPRINT_SIZE)
+    
+    def _configFingerprint(self):
+        """Digest of the EEPROM configuration blocks this library applies."""
+        h = hashlib.sha256(NxpNci_CLK_CONF)
+        h.update(NxpNci_TVDD_CONF_2ndGen)
+        h.update(NxpNci_RF_CONF_2ndGen)
+        return h.digest()[:CONFIG_FINGERPRINT_SIZE]
+    
+    def _readFingerprint(self):
+        """
+        Read the configuration fingerprint stored in the PN7150.
         
-        return False  # Success
+        Returns:
+            bytes or None: Stored fingerprint, None if it can't be read
+        """
+        self.writeData(NCI_GET_FINGERPRINT, len(NCI_GET_FINGERPRINT))
+        return self._storedFingerprint(self.getMessage(100))
+    
+    def _storedFingerprint(self, length):
+        """Fingerprint from the CORE_GET_CONFIG_RSP in rxBuffer, None if absent."""
+        rx = self.rxBuffer
+        # 40 03 <len> <status> <count> A0 14 <size> <fingerprint>
+        if (length < 8 + CONFIG_FINGERPRINT_SIZE or rx[0] != 0x40 or rx[1] != 0x03 or rx[3] != 0x00
+                or rx[5] != 0xA0 or rx[6] != 0x14 or rx[7] != CONFIG_FINGERPRINT_SIZE):
+            return None
+        return bytes(rx[8:8 + CONFIG_FINGERPRINT_SIZE])
     
     def ConfigMode(self, modeSE):
         """
@@ -688,69 +1773,36 @@ class lib_PN7150:
         Returns:
             int: SUCCESS (0) on success, ERROR (1) on failure
         """
-        mode = (MODE_RW if modeSE == 1 else MODE_CARDEMU if modeSE == 2 else MODE_P2P)
-        
-        Command = bytearray(MAX_NCI_FRAME_SIZE)
-        Item = 0
-        NCIDiscoverMap = bytearray([0x21, 0x00])
-        
-        # Emulation mode
-        DM_CARDEMU = bytearray([0x4, 0x2, 0x2])
-        R_CARDEMU = bytearray([0x1, 0x3, 0x0, 0x1, 0x4])
-        
-        # RW Mode
-        DM_RW = bytearray([0x1, 0x1, 0x1, 0x2, 0x1, 0x1, 0x3, 0x1, 0x1, 0x4, 0x1, 0x2, 0x80, 0x01, 0x80])
-        NCIPropAct = bytearray([0x2F, 0x02, 0x00])
-        
-        # P2P Support
-        DM_P2P = bytearray([0x5, 0x3, 0x3])
-        R_P2P = bytearray([0x1, 0x3, 0x0, 0x1, 0x5])
-        NCISetConfig_NFC = bytearray([0x20, 0x02, 0x1F, 0x02, 0x29, 0x0D, 0x46, 0x66, 0x6D, 0x01, 0x01, 0x11, 0x03, 0x02, 0x00, 0x01, 0x04, 0x01, 0xFA, 0x61, 0x0D, 0x46, 0x66, 0x6D, 0x01, 0x01, 0x11, 0x03, 0x02, 0x00, 0x01, 0x04, 0x01, 0xFA])
-        
-        NCIRouting = bytearray([0x21, 0x01, 0x07, 0x00, 0x01])
-        NCISetConfig_NFCA_SELRSP = bytearray([0x20, 0x02, 0x04, 0x01, 0x32, 0x01, 0x00])
-        
-        if mode == 0:
-            return SUCCESS
-        
         # Enable Proprietary interface for T4T card presence check procedure
         if modeSE == 1:
-            if mode == MODE_RW:
-                self.writeData(NCIPropAct, len(NCIPropAct))
-                self.getMessage()
-                
-                if (self.rxBuffer[0] != 0x4F) or (self.rxBuffer[1] != 0x02) or (self.rxBuffer[3] != 0x00):
-                    return ERROR
-        
-        # Building Discovery Map command
-        Item = 0
-        
-        if ((mode & MODE_CARDEMU and modeSE == 2) or (mode & MODE_P2P and modeSE == 3)):
-            if modeSE == 2:
-                for i in range(len(DM_CARDEMU)):
-                    Command[4 + (3 * Item) + i] = DM_CARDEMU[i]
-            else:
-                for i in range(len(DM_P2P)):
-                    Command[4 + (3 * Item) + i] = DM_P2P[i]
-            Item += 1
-        
-        if mode & MODE_RW and modeSE == 1:
-            for i in range(len(DM_RW)):
-                Command[4 + (3 * Item) + i] = DM_RW[i]
-            Item += len(DM_RW) // 3
-        
-        if Item != 0:
-            for i in range(len(NCIDiscoverMap)):
-                Command[i] = NCIDiscoverMap[i]
-            Command[2] = 1 + (Item * 3)
-            Command[3] = Item
-            self.writeData(Command, 3 + Command[2])
-            self.getMessage(10)
-            if (self.rxBuffer[0] != 0x41) or (self.rxBuffer[1] != 0x00) or (self.rxBuffer[3] != 0x00):
+            self.writeData(NCI_PROP_ACT, len(NCI_PROP_ACT))
+            self.getMessage()
+            
+            if (self.rxBuffer[0] != 0x4F) or (self.rxBuffer[1] != 0x02) or (self.rxBuffer[3] != 0x00):
                 return ERROR
         
+        # Discovery map for the mode
+        if modeSE == 1:
+            cmd = NCI_DISCOVER_MAP_RW
+        elif modeSE == 2:
+            cmd = NCI_DISCOVER_MAP_CE
+        else:
+            cmd = NCI_DISCOVER_MAP_P2P
+        self.writeData(cmd, len(cmd))
+        self.getMessage(10)
+        if (self.rxBuffer[0] != 0x41) or (self.rxBuffer[1] != 0x00) or (self.rxBuffer[3] != 0x00):
+            return ERROR
+        
         return SUCCESS
     
+    def _discoverCmd(self, modeSE):
+        """Return the RF_DISCOVER_CMD template for an operating mode."""
+        if modeSE == 1:
+            return NCI_DISCOVER_RW
+        elif modeSE == 2:
+            return NCI_DISCOVER_CE
+        return NCI_DISCOVER_P2P
+    
     def StartDiscovery(self, modeSE):
         """
         Start NFC tag discovery process.
@@ -767,30 +1819,9 @@ class lib_PN7150:
         Returns:
             int: SUCCESS (0) on success, ERROR (1) on failure
         """
-        if modeSE == 1:
-            TechTabSize = len(DiscoveryTechnologiesRW)
-            TechTab = DiscoveryTechnologiesRW
-        elif modeSE == 2:
-            TechTabSize = len(DiscoveryTechnologiesCE)
-            TechTab = DiscoveryTechnologiesCE
-        else:
-            TechTabSize = len(DiscoveryTechnologiesP2P)
-            TechTab = DiscoveryTechnologiesP2P
-        
-        global NCIStartDiscovery_length, NCIStartDiscovery
-        
-        NCIStartDiscovery_length = 0
-        NCIStartDiscovery[0] = 0x21
-        NCIStartDiscovery[1] = 0x03
-        NCIStartDiscovery[2] = (TechTabSize * 2) + 1
-        NCIStartDiscovery[3] = TechTabSize
-        
-        for i in range(TechTabSize):
-            NCIStartDiscovery[(i * 2) + 4] = TechTab[i]
-            NCIStartDiscovery[(i * 2) + 5] = 0x01
-        
-        NCIStartDiscovery_length = (TechTabSize * 2) + 4
-        self.writeData(NCIStartDiscovery, NCIStartDiscovery_length)
+        self._discoveryMode = modeSE
+        cmd = self._discoverCmd(modeSE)
+        self.writeData(cmd, len(cmd))
         self.getMessage()
         
         if (self.rxBuffer[0] != 0x41) or (self.rxBuffer[1] != 0x03) or (self.rxBuffer[3] != 0x00):
@@ -812,13 +1843,6 @@ class lib_PN7150:
         Returns:
             bool: True if tag was successfully activated, False otherwise
         """
-        NCIRfDiscoverSelect = bytearray([0x21, 0x04, 0x03, 0x01, PROT_ISODEP, INTF_ISODEP])
-        
-        # P2P Support
-        NCIStopDiscovery = bytearray([0x21, 0x06, 0x01, 0x00])
-        NCIRestartDiscovery = bytearray([0x21, 0x06, 0x01, 0x03])
-        saved_NTF = bytearray(7)
-        
         global gNextTag_Protocol
         gNextTag_Protocol = PROT_UNDETERMINED
         getFlag = False
@@ -835,11 +1859,7 @@ class lib_PN7150:
         
         # Is RF_INTF_ACTIVATED_NTF ?
         if self.rxBuffer[1] == 0x05:
-            pRfIntf.Interface = self.rxBuffer[4]
-            pRfIntf.Protocol = self.rxBuffer[5]
-            pRfIntf.ModeTech = self.rxBuffer[6]
-            pRfIntf.MoreTags = False
-            self.FillInterfaceInfo(pRfIntf, self.rxBuffer[10:])
+            self._fillActivation(pRfIntf)
             
             # P2P handling - simplified for now
             return True
@@ -864,17 +1884,7 @@ class lib_PN7150:
                 self.getMessage(100)
             
             # In case of multiple cards, select the first one
-            NCIRfDiscoverSelect[4] = pRfIntf.Protocol
-            if pRfIntf.Protocol == PROT_ISODEP:
-                NCIRfDiscoverSelect[5] = INTF_ISODEP
-            elif pRfIntf.Protocol == PROT_NFCDEP:
-                NCIRfDiscoverSelect[5] = INTF_NFCDEP
-            elif pRfIntf.Protocol == PROT_MIFARE:
-                NCIRfDiscoverSelect[5] = INTF_TAGCMD
-            else:
-                NCIRfDiscoverSelect[5] = INTF_FRAME
-            
-            self.writeData(NCIRfDiscoverSelect, len(NCIRfDiscoverSelect))
+            self._writeSelect(pRfIntf.Protocol)
             self.getMessage(100)
             
             if (self.rxBuffer[0] == 0x41) and (self.rxBuffer[1] == 0x04) and (self.rxBuffer[3] == 0x00):
@@ -882,23 +1892,47 @@ class lib_PN7150:
             else:
                 return False
     
-    def FillInterfaceInfo(self, pRfIntf, pBuf):
-        """EXACT translation of Arduino FillInterfaceInfo() method"""
-        if pRfIntf.Protocol == PROT_T1T:
-            pRfIntf.Info.NFC_APP.SensRes[0] = pBuf[0]
-            pRfIntf.Info.NFC_APP.SensRes[1] = pBuf[1]
-            pRfIntf.Info.NFC_APP.NfcIdLen = pBuf[2]
-            for i in range(pRfIntf.Info.NFC_APP.NfcIdLen):
-                pRfIntf.Info.NFC_APP.NfcId[i] = pBuf[3 + i]
-        elif pRfIntf.Protocol == PROT_T2T:
-            pRfIntf.Info.NFC_APP.SensRes[0] = pBuf[0]
-            pRfIntf.Info.NFC_APP.SensRes[1] = pBuf[1]
-            pRfIntf.Info.NFC_APP.NfcIdLen = pBuf[2]
-            for i in range(pRfIntf.Info.NFC_APP.NfcIdLen):
-                pRfIntf.Info.NFC_APP.NfcId[i] = pBuf[3 + i]
-            pRfIntf.Info.NFC_APP.SelResLen = pBuf[3 + pRfIntf.Info.NFC_APP.NfcIdLen]
-            if pRfIntf.Info.NFC_APP.SelResLen > 0:
-                pRfIntf.Info.NFC_APP.SelRes[0] = pBuf[4 + pRfIntf.Info.NFC_APP.NfcIdLen]
+    def FillInterfaceInfo(self, pRfIntf, pBuf=None):
+        """
+        Decode the RF_INTF_ACTIVATED_NTF in rxBuffer into pRfIntf.
+        
+        pRfIntf.Tag is filled by TagInfo_t.parse(); the per-technology
+        Info structures of the Arduino library are filled from it for
+        NFC-A, NFC-B, NFC-F and ISO15693 alike.
+        
+        Args:
+            pRfIntf (RfIntf_t): Interface structure to populate
+            pBuf: Ignored, kept for compatibility
+        """
+        rx = self.rxBuffer
+        tag = pRfIntf.Tag
+        tag.parse(rx, self.rxMessageLength)
+        tech = tag.ModeTech
+        if tech == MODE_POLL | TECH_PASSIVE_NFCA:
+            info = pRfIntf.Info.NFC_APP
+            info.SensRes[:] = tag.SensRes[:2]
+            info.NfcIdLen = tag.NfcIdLen
+            info.NfcId[:] = tag.NfcId
+            info.SelResLen = 0 if tag.SelRes < 0 else 1
+            info.SelRes[0] = max(tag.SelRes, 0)
+            info.RatsLen = tag.RatsLen
+            info.Rats[:] = tag.Rats
+        elif tech == MODE_POLL | TECH_PASSIVE_NFCB:
+            info = pRfIntf.Info.NFC_BPP
+            info.SensResLen = min(tag.SensResLen, len(info.SensRes))
+            info.SensRes[:info.SensResLen] = tag.SensRes[:info.SensResLen]
+            info.AttribResLen = min(tag.RatsLen, len(info.AttribRes))
+            info.AttribRes[:info.AttribResLen] = tag.Rats[:info.AttribResLen]
+        elif tech == MODE_POLL | TECH_PASSIVE_NFCF:
+            info = pRfIntf.Info.NFC_FPP
+            info.BitRate = rx[ACT_PARAMS]
+            info.SensResLen = tag.SensResLen
+            info.SensRes[:] = tag.SensRes
+        elif tech == MODE_POLL | TECH_PASSIVE_15693:
+            info = pRfIntf.Info.NFC_VPP
+            info.AFI = rx[ACT_PARAMS]
+            info.DSFID = rx[ACT_PARAMS + 1]
+            info.ID[:] = tag.NfcId[:8]
 
     def SendApduCommand(self, apdu_cmd):
         """
@@ -917,38 +1951,23 @@ class lib_PN7150:
         # DATA_PACKET format: [0x00, 0x00, CommandSize, CommandData]
         # This is the correct format for ISO-DEP communication
         
-        cmd_length = len(apdu_cmd)
-        data_packet = bytearray([0x00, 0x00, cmd_length]) + apdu_cmd
-        
-        print(f"  DATA_PACKET CMD: {self.print_hex_array(data_packet, len(data_packet))}")
-        
-        # Send the DATA_PACKET
-        self.writeData(data_packet, len(data_packet))
+        # Send the DATA_PACKET, assembled in the reusable TX frame.
+        # Frames are traced by writeData()/readData(), see setTrace()
+        self._writeDataPacket(apdu_cmd)
         
         # Get immediate response (acknowledgment) - EXACT like official library
         self.getMessage()
-        print(f"  Immediate response: {self.print_hex_array(self.rxBuffer, self.rxMessageLength)}")
         
         # Wait for actual data response - EXACT like official library
         if self.getMessage(1000):  # 1 second timeout
-            print(f"  Data response: {self.print_hex_array(self.rxBuffer, self.rxMessageLength)}")
-            
             # Check if it's a DATA_PACKET response
             if self.rxBuffer[0] == 0x00 and self.rxBuffer[1] == 0x00:
                 payload_length = self.rxBuffer[2]
                 if payload_length > 0:
-                    response = self.rxBuffer[3:3+payload_length]
-                    print(f"  DATA_PACKET RSP: {self.print_hex_array(response, len(response))}")
-                    return response
-                else:
-                    print("  Empty response")
-                    return None
-            else:
-                print(f"  Unexpected response format: {self.print_hex_array(self.rxBuffer, self.rxMessageLength)}")
-                return None
-        else:
-            print("  No data response received")
-            return None
+                    return self.rxBuffer[3:3+payload_length]
+        # empty, unexpected or no data response
+        self._traceError()
+        return None
 
     def print_hex_array(self, data, length):
         """
@@ -964,10 +1983,7 @@ class lib_PN7150:
         Returns:
             str: Formatted hexadecimal string (e.g., "0x01 0x02 0x03")
         """
-        result = ""
-        for i in range(min(length, len(data))):
-            result += f"0x{data[i]:02X} "
-        return result.strip()
+        return ' '.join(['0x%02X' % data[i] for i in range(min(length, len(data)))])
 
     def StopDiscovery(self):
         """
@@ -980,10 +1996,11 @@ class lib_PN7150:
         Returns:
             bool: True on success
         """
-        NCIStopDiscovery = bytearray([0x21, 0x06, 0x01, 0x00])
-        self.writeData(NCIStopDiscovery, len(NCIStopDiscovery))
+        self.writeData(NCI_RF_DEACTIVATE_IDLE, len(NCI_RF_DEACTIVATE_IDLE))
         self.getMessage()
-        self.getMessage(1000)
+        if self.rfState != RFST_IDLE:
+            # a tag was active, wait for its RF_DEACTIVATE_NTF
+            self.getMessage(1000)
         return True
 
  
\ No newline at end of file
@@ -1,16 +1,71 @@
 import utime
 import machine
 import hashlib
-import os
+import binascii
 import asyncio
 import network
-import requests
-import _thread
-from umqtt.simple import MQTTClient
+import random
+from doorman2_mqtt import MQTTClient
 from doorman2_nfc import Nfc
+from doorman2_hashdb import HashDb, StaleDelta
+from doorman2_events import EventQueue, EventJournal, DROP_OLDEST
+from doorman2_metrics import metrics
 
 DEBUG = True
 
+# TODO: add auth support to http server
+HASHES_URL = "http://10.11.1.1:8000/hashes/internal"
+HASHES_ETAG_FILE = 'hashes_etag'
+# emit a sync progress event every this many downloaded bytes
+SYNC_PROGRESS_STEP = 16 * 1024
+# a sync server that connects, answers or sends nothing for this long is given up on
+SYNC_TIMEOUT_MS = 10000
+
+# keepalive is needed due to: https://github.com/eclipse/mosquitto/issues/2462
+MQTT_KEEPALIVE = 5
+# the session is dropped when a PINGREQ stays unanswered for this long
+MQTT_PING_TIMEOUT_MS = MQTT_KEEPALIVE * 1500
+# reconnect delays grow from the base to the max; a connection that stayed
+# up for MQTT_STABLE_MS counts as healthy and is retried immediately
+MQTT_BACKOFF_MS = 500
+MQTT_BACKOFF_MAX_MS = 60000
+MQTT_STABLE_MS = 30000
+# leave reassociation to the WiFi driver for this long before calling connect()
+WIFI_RECONNECT_MS = 10000
+WIFI_BACKOFF_MAX_MS = 120000
+
+# Net.state values
+LINK_DOWN = 0    # no WiFi association
+BROKER_DOWN = 1  # WiFi up, no MQTT session
+CONNECTED = 2
+
+# events kept in RAM while the broker is unreachable, and how many are
+# published before yielding to other tasks
+EVENT_QUEUE_SIZE = 64
+EVENT_QUEUE_POLICY = DROP_OLDEST
+EVENT_BATCH = 8
+# how often buffered events are written to the on-flash journal
+JOURNAL_FLUSH_MS = 2000
+# metrics snapshots (doorman2_metrics) are published this often
+METRICS_TOPIC = "locks/internal/metrics"
+METRICS_INTERVAL_MS = 60000
+# a card and a PIN pair up when the second arrives within this long of the
+# first; PIN digits may be typed before the card is read
+AUTH_WINDOW_MS = 10000
+
+_pin_waits = metrics.histogram('keypad.pin_us')  # card read to PIN complete
+_hashing = metrics.histogram('auth.hash_us')
+_lookups = metrics.histogram('auth.lookup_us')
+_decisions = metrics.histogram('auth.decision_us')  # PIN entered to door/denial
+_granted = metrics.counter('auth.granted')
+_denied = metrics.counter('auth.denied')
+_pin_timeouts = metrics.counter('auth.pin_timeouts')
+_syncs = metrics.histogram('sync.us')
+_sync_failures = metrics.counter('sync.failures')
+_sync_unchanged = metrics.counter('sync.not_modified')
+_sync_fallbacks = metrics.counter('sync.full_fallbacks')
+_mqtt_connects = metrics.counter('mqtt.connects')
+
 class Keypad:
     CMD_RESET = 'F'
     CMD_ENABLE_FEEDBACK = 'Q'
@@ -21,114 +76,413 @@ class Keypad:
 
     def __init__(self, uart):
         self._uart = uart
+        # wakes the reader as soon as a byte arrives, nothing polls the UART
+        self._stream = asyncio.StreamReader(uart)
 
     def write(self, data):
         self._uart.write(data)
         self._uart.flush()
 
-    async def get_pin(self, timeout_ms=10000):
-        uart = self._uart
+    async def read_digits(self):
+        """Wait for key presses; returns the digits among them as bytes."""
+        while True:
+            # whatever arrived together, a PIN typed ahead comes in one read
+            data = bytes(c for c in await self._stream.read(8) if ord('0') <= c <= ord('9'))
+            if data:
+                # print(f"rx: {data}")
+                return data
+
+
+class AuthEntry:
+    """
+    Pairs card reads with PIN entry, in either order.
+
+    Two tasks collect cards and keypad digits as they come, so keys typed
+    before the card registers are kept. The card-dependent part of the hash
+    input is computed as soon as the UID arrives; once both halves are in,
+    only the PIN part is left to hash.
+    """
+
+    def __init__(self, nfc, keypad):
+        self._nfc = nfc
+        self._keypad = keypad
+        self._suffix = None  # card_suffix() of the pending card
+        self._card_at = 0
+        self._card_us = 0
+        self._pin = bytearray()
+        self._pin_at = 0  # last digit
+        self._changed = asyncio.Event()
+        asyncio.create_task(self._cards())
+        asyncio.create_task(self._keys())
+
+    async def _cards(self):
+        while True:
+            card_data = await self._nfc.wait_uid()
+
+            # Check if this is HCE data or UID data
+            # HCE data is typically 6+ bytes (we get 6 bytes from HCE)
+            # Physical card UIDs are usually 4, 7, or 10 bytes
+            # Use length as primary indicator: HCE responses are typically 6 bytes
+            is_hce_data = len(card_data) == 6  # HCE responses are exactly 6 bytes in our case
+
+            if is_hce_data:
+                # This is HCE response data - use full response for hash generation
+                print("HCE Device detected: " + card_data.hex())
+            else:
+                # This is a physical card UID - use first 4 bytes for hash generation
+                print("Card UUID: " + ''.join('{:02x}'.format(x) for x in card_data))
+
+            # a newer card replaces one still waiting for its PIN
+            self._suffix = card_suffix(card_data)
+            self._card_at = utime.ticks_ms()
+            self._card_us = utime.ticks_us()
+            if len(self._pin) < 4:
+                self._keypad.write(Keypad.CMD_LED_GREEN)
+            self._changed.set()
+
+    async def _keys(self):
+        while True:
+            digits = await self._keypad.read_digits()
+            now = utime.ticks_ms()
+            # a PIN abandoned halfway does not prefix the next one
+            if utime.ticks_diff(now, self._pin_at) >= AUTH_WINDOW_MS:
+                self._pin = bytearray()
+            # the last 4 digits count, so a mistyped PIN is simply typed again
+            self._pin = (self._pin + digits)[-4:]
+            self._pin_at = now
+            if len(self._pin) == 4:
+                self._changed.set()
+
+    async def next(self):
+        """
+        Wait for the next card and PIN pair.
+
+        Cards and digits that arrived while the previous attempt was being
+        handled are dropped.
+
+        Returns:
+            tuple or None: (pin, card suffix), None if a card got no PIN
+            within AUTH_WINDOW_MS
+        """
+        self._suffix = None
+        self._pin = bytearray()
+        self._keypad.write(Keypad.CMD_ENABLE_FEEDBACK)
+        while True:
+            self._changed.clear()
+            if self._suffix is None:
+                await self._changed.wait()
+                continue
+
+            now = utime.ticks_ms()
+            if len(self._pin) == 4:
+                if utime.ticks_diff(now, self._pin_at) < AUTH_WINDOW_MS:
+                    _pin_waits.since(self._card_us)
+                    pin, suffix = self._pin, self._suffix
+                    self._suffix = None
+                    self._pin = bytearray()
+                    return pin, suffix
+                # typed too long before the card
+                self._pin = bytearray()
+                self._keypad.write(Keypad.CMD_LED_GREEN)
+
+            left = AUTH_WINDOW_MS - utime.ticks_diff(now, self._card_at)
+            if left <= 0:
+                self._suffix = None
+                self._pin = bytearray()
+                return None
+            try:
+                await asyncio.wait_for_ms(self._changed.wait(), left)
+            except asyncio.TimeoutError:
+                pass
+
 
-        # discard previous bytes
-        uart.read(uart.any())
+class Backoff:
+    """
+    Jittered exponential backoff.
 
-        uart.write(self.CMD_ENABLE_FEEDBACK)
-        uart.write(self.CMD_LED_GREEN)
-        uart.flush()
+    The first retry after reset() happens immediately, so a brief drop
+    recovers at once; following delays double from `base_ms` up to
+    `max_ms`, each randomised into the upper half of its range so a fleet
+    of locks does not reconnect in lockstep.
+    """
 
-        data = bytearray()
-        while len(data) < 4 and timeout_ms > 0:
-            n = uart.any()
-            for c in uart.read(n):
-                if ord('0') <= c <= ord('9'):
-                    # print(f"rx: {c}")
-                    data.append(c)
-            await asyncio.sleep(0.1)
-            timeout_ms -= 100
+    def __init__(self, base_ms, max_ms):
+        self._base = base_ms
+        self._max = max_ms
+        self._delay = 0
 
-        return data[:4]
+    def reset(self):
+        self._delay = 0
+
+    def next(self):
+        """Return the delay in ms before the next attempt."""
+        delay = self._delay
+        self._delay = min(self._max, max(self._base, delay * 2))
+        if not delay:
+            return 0
+        half = delay // 2
+        return half + random.getrandbits(16) % (half + 1)
 
 
 class Net:
-    def __init__(self):
+    def __init__(self, db):
+        self._db = db
+        self._etag = None
+        try:
+            with open(HASHES_ETAG_FILE) as f:
+                self._etag = f.read().strip() or None
+        except OSError:
+            pass
+        self._sync_requested = asyncio.Event()
         self._connected = False
+        self._link_up = asyncio.Event()
         self._wlan = network.WLAN(network.STA_IF)
-
-        self._events = []
-        # keepalive is needed due to: https://github.com/eclipse/mosquitto/issues/2462
-        self._mqtt = MQTTClient("lock", "10.11.1.1", keepalive=5)
+        self._wifi_backoff = Backoff(WIFI_RECONNECT_MS, WIFI_BACKOFF_MAX_MS)
+        self._wifi_retry_at = 0
+        self.state = LINK_DOWN
+
+        self._events = EventQueue(EVENT_QUEUE_SIZE, EVENT_QUEUE_POLICY)
+        self._journal = EventJournal()
+        # set whenever there is something for the MQTT task to publish
+        self._events_ready = asyncio.Event()
+        self._mqtt = MQTTClient("lock", "10.11.1.1", keepalive=MQTT_KEEPALIVE)
         self._mqtt.set_callback(self._mqtt_cb)
+        self._metrics_due = utime.ticks_ms()
 
     async def loop(self):
         self.start()
+        asyncio.create_task(self._sync_loop())
+        asyncio.create_task(self._run_mqtt())
+        flushed = utime.ticks_ms()
         while True:
             self.update()
-            await asyncio.sleep(0.5)
+            if utime.ticks_diff(utime.ticks_ms(), flushed) >= JOURNAL_FLUSH_MS:
+                flushed = utime.ticks_ms()
+                self._journal.flush()
+            # watch closely while the link is down so recovery is noticed fast
+            await asyncio.sleep_ms(1000 if self._connected else 100)
 
     def _mqtt_cb(self, topic, msg):
         if topic == b'locks/internal/command':
             if msg == b'sync':
-                try:
-                    print("starting sync")
-                    # TODO: add auth support to http server
-                    url = "http://10.11.1.1:8000/hashes/internal"
-                    print(f"fetching: {url}")
-                    rsp = requests.get(url)
-                    print(f"sync code: {rsp.status_code}")
-                    with open('hashes_new', 'wb') as f:
-                        if 200 <= rsp.status_code < 300:
-                            while True:
-                                chunk = rsp.raw.read(512)
-                                if not chunk:
-                                    break
-                                f.write(chunk)
-                    os.rename('hashes_new', 'hashes')
-                    print("sync finished")
-                    self.send_event("sync", 'success'.encode())
-                except Exception as e:
-                    print(f"sync error: {e}")
-                    self.send_event("sync", 'fail'.encode())
+                # only flag it, the download must not block MQTT receive
+                self._sync_requested.set()
             else:
                 print(f"uncrecognised command: {msg}")
 
+    async def _sync_loop(self):
+        while True:
+            await self._sync_requested.wait()
+            self._sync_requested.clear()
+            start = utime.ticks_us()
+            try:
+                print("starting sync")
+                self.send_event("sync", 'start'.encode())
+                await self._sync()
+                print("sync finished")
+                self.send_event("sync", 'success'.encode())
+                _syncs.since(start)
+            except Exception as e:
+                print(f"sync error: {e}")
+                self.send_event("sync", 'fail'.encode())
+                _sync_failures.inc()
+
+    async def _download(self, url, path, etag=None):
+        """
+        Fetch url into path, verifying the body against X-Content-SHA256.
+
+        A response without a digest must at least carry a Content-Length
+        that matches the body, so a cut-off transfer is never installed.
+        The request runs on asyncio streams and every step is bounded by
+        SYNC_TIMEOUT_MS, so a stalled server never holds up auth or MQTT.
+
+        Returns:
+            str or None: ETag of the response, or None if the server
+            answered 304 Not Modified and nothing was written
+        """
+        print(f"fetching: {url}")
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        status, rsp_headers, reader, writer = await _http_get(url, headers)
+        try:
+            print(f"sync code: {status}")
+            if status == 304:
+                return None
+            if not 200 <= status < 300:
+                raise Exception(f"http status {status}")
+
+            expected = rsp_headers.get('x-content-sha256')
+            length = rsp_headers.get('content-length')
+            if expected is None and length is None:
+                raise Exception("server sent neither digest nor length")
+            digest = hashlib.sha256()
+            size = 0
+            with open(path, 'wb') as f:
+                while True:
+                    chunk = await asyncio.wait_for_ms(reader.read(512), SYNC_TIMEOUT_MS)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                    if size % SYNC_PROGRESS_STEP < len(chunk):
+                        self.send_event("sync", f'progress:{size}'.encode())
+
+            if length is not None and size != int(length):
+                raise Exception(f"payload truncated: {size} of {length} bytes")
+            if expected is None:
+                print("sync: server sent no digest, only the length was checked")
+            elif binascii.hexlify(digest.digest()).decode() != expected.lower():
+                raise Exception("payload digest mismatch")
+            return rsp_headers.get('etag') or ''
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def _sync(self):
+        # report our version so the server can answer with a delta
+        version = self._db.version
+        url = HASHES_URL
+        if version:
+            url = f"{url}?since={version}"
+
+        etag = await self._download(url, 'hashes_new', self._etag if version else None)
+        if etag is None:
+            print("sync: hashes not modified")
+            _sync_unchanged.inc()
+            return
+        try:
+            await self._db.apply('hashes_new')
+        except StaleDelta as e:
+            print(f"sync: {e}, falling back to full download")
+            _sync_fallbacks.inc()
+            etag = await self._download(HASHES_URL, 'hashes_new')
+            await self._db.install('hashes_new')
+
+        if etag != (self._etag or ''):
+            self._etag = etag
+            with open(HASHES_ETAG_FILE, 'w') as f:
+                f.write(etag)
 
     def send_event(self, name, payload):
-        # TODO: limit number of events in queue
-        self._events.append((name, payload))
-
-
-    def _run_mqtt(self):
+        # only buffered here, the journal is written from the network loop
+        # (apart from the short seq reservation every SEQ_RESERVE events)
+        seq = self._journal.append(name, payload)
+        if not self._events.put(name, payload, seq):
+            print(f"event queue full, {name} event {seq} left in journal")
+        self._events_ready.set()
+
+    async def _publish_event(self, name, payload, seq):
+        # the sequence number lets the broker side drop replayed duplicates
+        print("sending event")
+        await self._mqtt.publish(f"locks/internal/events/{name}", b'%d:%s' % (seq, payload))
+        self._journal.ack(seq)
+
+    async def _run_mqtt(self):
         mqtt = self._mqtt
+        backoff = Backoff(MQTT_BACKOFF_MS, MQTT_BACKOFF_MAX_MS)
+        mac_sent = False
         while True:
+            if not self._link_up.is_set():
+                # nothing to gain from hammering the broker without a link
+                self.state = LINK_DOWN
+                await self._link_up.wait()
+                backoff.reset()
+
+            self.state = BROKER_DOWN
+            rx = None
+            since = utime.ticks_ms()
             try:
-                while True:
-                    mqtt.connect()
-                    mqtt.publish("locks/internal/mac", self._wlan.config('mac').hex())
-                    mqtt.subscribe("locks/internal/command")
-
-                    i = 0
-                    while True:
-                        try:
-                            while True:
-                                name, payload = self._events.pop()
-                                print("sending event")
-                                mqtt.sock.setblocking(True)
-                                mqtt.publish(f"locks/internal/events/{name}", payload)
-                        except IndexError:
-                            pass
-
-                        if i == 10:
-                            i = 0
-                            mqtt.ping()
-                        else:
-                            i += 1
-
-                        mqtt.check_msg()
-                        utime.sleep(0.25)
-
+                # keep the session on the broker, so a reconnect after a
+                # hiccup does not need to subscribe again
+                session = await mqtt.connect(clean_session=False)
+                self.state = CONNECTED
+                _mqtt_connects.inc()
+                since = utime.ticks_ms()
+                if not mac_sent:
+                    await mqtt.publish("locks/internal/mac", self._wlan.config('mac').hex(), retain=True)
+                    mac_sent = True
+                if not session:
+                    await mqtt.subscribe("locks/internal/command")
+                rx = asyncio.create_task(self._mqtt_rx())
+                await self._mqtt_tx()
             except Exception as e:
                 print(f"mqtt exception: {e}")
-                utime.sleep(6)
+            finally:
+                if rx is not None:
+                    rx.cancel()
+                await mqtt.close()
+
+            if self.state == CONNECTED and utime.ticks_diff(utime.ticks_ms(), since) >= MQTT_STABLE_MS:
+                backoff.reset()
+            self.state = BROKER_DOWN
+            self.update()
+            if not self._link_up.is_set():
+                continue
+            delay = backoff.next()
+            if delay:
+                print(f"mqtt: reconnecting in {delay} ms")
+                await asyncio.sleep_ms(delay)
+
+    async def _mqtt_rx(self):
+        try:
+            while True:
+                await self._mqtt.wait_msg()
+        except Exception as e:
+            print(f"mqtt receive failed: {e}")
+            await self._mqtt.close()
+        finally:
+            # wake the publisher so it notices the dead connection
+            self._events_ready.set()
+
+    async def _mqtt_tx(self):
+        mqtt = self._mqtt
+        # events dropped from RAM or left over from before a reboot are
+        # still in the journal, send those first
+        replaying = True
+        dropped = self._events.dropped
+        while mqtt.connected:
+            if not self._link_up.is_set():
+                print("mqtt: link lost, closing session")
+                return
+            if mqtt.ping_overdue(MQTT_PING_TIMEOUT_MS):
+                print("mqtt: no PINGRESP, closing session")
+                return
+            if self._events.dropped != dropped:
+                dropped = self._events.dropped
+                replaying = True
+
+            if replaying:
+                # straight from the journal in seq order, so an event the
+                # queue dropped is sent before anything newer acks past it;
+                # queued events sent here are skipped below
+                backlog = self._journal.unacked(None, EVENT_BATCH)
+                replaying = bool(backlog)
+                for name, payload, seq in backlog:
+                    await self._publish_event(name, payload, seq)
+                continue
+
+            for _ in range(EVENT_BATCH):
+                event = self._events.peek()
+                if event is None:
+                    break
+                if event[2] > self._journal.acked:
+                    await self._publish_event(*event)
+                self._events.pop(event)
+            if len(self._events):
+                continue
+
+            if utime.ticks_diff(utime.ticks_ms(), self._metrics_due) >= 0:
+                # values are cumulative, a snapshot lost with the connection costs nothing
+                self._metrics_due = utime.ticks_add(utime.ticks_ms(), METRICS_INTERVAL_MS)
+                await mqtt.publish(METRICS_TOPIC, metrics.snapshot())
+
+            self._events_ready.clear()
+            try:
+                await asyncio.wait_for(self._events_ready.wait(), MQTT_KEEPALIVE / 2)
+            except asyncio.TimeoutError:
+                await mqtt.ping()
 
     def start(self):
         self._wlan.active(True)
@@ -136,26 +490,36 @@ class Net:
         #     print(f'scan: {net}')
         print("mac:", self._wlan.config('mac').hex())
 
-        _thread.start_new_thread(self._run_mqtt, ())
-
         with open('wifi', 'r') as f:
-            ssid = f.readline().strip()
-            key = f.readline().strip()
+            self._ssid = f.readline().strip()
+            self._key = f.readline().strip()
 
         if not self._wlan.isconnected():
-            print(f'connecting to network ssid={ssid!r}')
-            self._wlan.connect(ssid, key)
+            self._wifi_connect()
 
+    def _wifi_connect(self):
+        print(f'connecting to network ssid={self._ssid!r}')
+        self._wifi_retry_at = utime.ticks_add(utime.ticks_ms(), WIFI_RECONNECT_MS + self._wifi_backoff.next())
+        self._wlan.connect(self._ssid, self._key)
 
     def update(self):
         if self._wlan.isconnected():
             if not self._connected:
                 print('network config:', self._wlan.ifconfig())
                 self._connected = True
+                self._wifi_backoff.reset()
+                self._link_up.set()
         else:
             if self._connected:
                 print('disconnected')
                 self._connected = False
+                self._link_up.clear()
+                # wake the publisher so it drops the session
+                self._events_ready.set()
+                # the driver reassociates on its own, only step in if it doesn't
+                self._wifi_retry_at = utime.ticks_add(utime.ticks_ms(), WIFI_RECONNECT_MS)
+            elif utime.ticks_diff(utime.ticks_ms(), self._wifi_retry_at) >= 0:
+                self._wifi_connect()
 
 
 class Door:
@@ -170,63 +534,99 @@ class Door:
         if self._pin is not None:
             self._pin.value(0)
 
+async def _http_get(url, headers):
+    """
+    Send an HTTP/1.0 GET over asyncio streams.
+
+    Args:
+        url (str): http://host[:port]/path URL
+        headers (dict): Extra request headers
+
+    Returns:
+        tuple: (status, response headers with lower-case names, reader,
+        writer); the caller reads the body and closes the writer
+
+    Raises:
+        asyncio.TimeoutError: If a step takes longer than SYNC_TIMEOUT_MS
+    """
+    _, _, hostport, path = url.split('/', 3)
+    host, _, port = hostport.partition(':')
+    reader, writer = await asyncio.wait_for_ms(asyncio.open_connection(host, int(port or 80)), SYNC_TIMEOUT_MS)
+    try:
+        # HTTP/1.0: no chunked encoding, the body ends when the server closes
+        request = f'GET /{path} HTTP/1.0\r\nHost: {hostport}\r\n'
+        for name, value in headers.items():
+            request += f'{name}: {value}\r\n'
+        writer.write((request + '\r\n').encode())
+        await asyncio.wait_for_ms(writer.drain(), SYNC_TIMEOUT_MS)
+
+        line = await asyncio.wait_for_ms(reader.readline(), SYNC_TIMEOUT_MS)
+        status = int(line.split(None, 2)[1])
+        rsp_headers = {}
+        while True:
+            line = await asyncio.wait_for_ms(reader.readline(), SYNC_TIMEOUT_MS)
+            if not line.strip():
+                break
+            name, _, value = line.decode().partition(':')
+            rsp_headers[name.strip().lower()] = value.strip()
+    except Exception:
+        writer.close()
+        await writer.wait_closed()
+        raise
+    return status, rsp_headers, reader, writer
+
+def card_suffix(card_uid):
+    """Card-dependent tail of the generate_hash() input, b':<uid hex>'."""
+    # HCE tokens are hashed by their first 4 bytes too
+    return b':' + binascii.hexlify(bytes(reversed(card_uid[:4])))
+
+def pin_hash(pin, suffix):
+    """Raw generate_hash() digest for a PIN and a card_suffix()."""
+    return hashlib.sha256(b'%08x' % int(pin) + suffix).digest()
+
 def generate_hash(card_uid, pin):
-    card_uid = bytes(reversed(card_uid[:4])).hex()
-    s = "{:08x}:{}".format(int(pin), card_uid)
-    hash=hashlib.sha256(s.encode('ascii')).digest().hex()
-    return hash
+    return binascii.hexlify(pin_hash(pin, card_suffix(card_uid))).decode()
 
 
 
-async def handle_auth(nfc, keypad, door, net):
+async def handle_auth(nfc, keypad, door, net, db):
+    entry = AuthEntry(nfc, keypad)
     while True:
-        card_data = await nfc.wait_uid()
-        
-        # Check if this is HCE data or UID data
-        # HCE data is typically 6+ bytes (we get 6 bytes from HCE)
-        # Physical card UIDs are usually 4, 7, or 10 bytes
-        # Use length as primary indicator: HCE responses are typically 6 bytes
-        is_hce_data = len(card_data) == 6  # HCE responses are exactly 6 bytes in our case
-        
-        if is_hce_data:
-            # This is HCE response data - use full response for hash generation
-            print("HCE Device detected: " + card_data.hex())
-            card_uid = card_data  # Use full HCE response as card_uid
-        else:
-            # This is a physical card UID - use first 4 bytes for hash generation
-            print("Card UUID: " + ''.join('{:02x}'.format(x) for x in card_data))
-            card_uid = card_data[:4]  # Use first 4 bytes as card_uid
-        
-        pin = await keypad.get_pin()
+        attempt = await entry.next()
         keypad.write(keypad.CMD_RESET)
 
-        if len(pin) < 4:
+        if attempt is None:
             print("Pin timeout")
+            _pin_timeouts.inc()
             keypad.write(keypad.CMD_DENIED)
             await asyncio.sleep(0.5)
             keypad.write(keypad.CMD_RESET)
             continue
 
-        hash = generate_hash(card_uid, pin)
-        print(f'Card hash: {hash}')
+        pin, suffix = attempt
+        start = utime.ticks_us()
+        digest = pin_hash(pin, suffix)
+        _hashing.since(start)
+        hash = binascii.hexlify(digest)
+        print(f'Card hash: {hash.decode()}')
 
-        hash_found = False
-        with open("hashes") as f:
-            for user in f:
-                if(user.strip() == hash):
-                    hash_found = True
-                    break
+        lookup = utime.ticks_us()
+        hash_found = digest in db
+        _lookups.since(lookup)
 
-        net.send_event("hash", hash.encode())
+        net.send_event("hash", hash)
 
         try:
             if hash_found:
                 print('Known hash, opening door')
                 keypad.write(keypad.CMD_GRANTED)
                 door.unlock()
+                _granted.inc()
             else:
                 print('Unknown hash, ignoring')
                 keypad.write(keypad.CMD_DENIED)
+                _denied.inc()
+            _decisions.since(start)
 
             await asyncio.sleep(2)
 
@@ -240,11 +640,12 @@ async def main():
     keypad.write(keypad.CMD_RESET)
     door = Door(machine.Pin(2, machine.Pin.OUT))
     door.lock()
-    net = Net()
+    db = HashDb()
+    net = Net(db)
     nfc = Nfc()
 
     await asyncio.gather(
-        handle_auth(nfc, keypad, door, net),
+        handle_auth(nfc, keypad, door, net, db),
         nfc.loop(),
         net.loop()
     )
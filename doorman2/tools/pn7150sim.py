@@ -0,0 +1,883 @@
+#!/usr/bin/env python3
+"""
+Host-side PN7150 simulator.
+
+Stand-ins for the MicroPython `machine` (I2C, Pin with IRQ, UART) and
+`micropython` modules and for the MicroPython-only parts of `time` and
+`asyncio`, plus an NCI device model on the fake I2C bus, so lib_PN7150,
+doorman2_nfc and the TESTED scanners run unmodified under CPython.
+
+The device answers CORE_RESET/INIT, CORE_SET/GET_CONFIG, proprietary
+commands, RF_DISCOVER_MAP, RF_DISCOVER, RF_DISCOVER_SELECT and
+RF_DEACTIVATE, activates scripted tags with RF_INTF_ACTIVATED_NTF (or
+RF_DISCOVER_NTFs when several are in the field) and answers ISO-DEP data
+packets. Response and activation latency are configurable, and faults can
+be injected: unanswered commands, corrupted reads, NAKed writes, NCI error
+notifications and a wedged controller that only a CORE_RESET or a VEN
+power cycle brings back.
+
+As a library:
+
+    import pn7150sim
+    device = pn7150sim.install()        # before importing lib_PN7150
+    device.tap(pn7150sim.Tag(b'\\x04\\x11\\x22\\x33'))
+
+Run on its own it taps tags on doorman2_nfc (or a TESTED scanner) and
+reports the tap-to-UID latency and the I2C traffic per tag; with --held it
+leaves a phone and then a card on the reader and reports what that costs.
+
+usage: pn7150sim.py [-n 50] [--latency-ms 1] [--hce] [--drop P] [--corrupt P]
+                    [--nak P] [--wedge-every N] [--seed S] [--tap-ms 150]
+                    [--held SECONDS] [--scanner PATH]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import types
+
+ESP32_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'esp32')
+
+POLL_S = 0.0005  # How often waiting code lets the simulated hardware run
+
+# NCI status codes
+STATUS_OK = 0x00
+STATUS_REJECTED = 0x01
+STATUS_NOT_INITIALIZED = 0x04
+STATUS_SYNTAX_ERROR = 0x05
+STATUS_SEMANTIC_ERROR = 0x06
+STATUS_INVALID_PARAM = 0x09
+
+# CORE_SET_CONFIG parameters with a fixed size
+CONFIG_SIZES = {b'\xa0\x14': 8}   # NXP timestamp/config ID
+
+# RF protocols and interfaces of the scripted tags
+PROT_T2T = 0x02
+PROT_ISODEP = 0x04
+PROT_MIFARE = 0x80
+INTF_FRAME = 0x01
+INTF_ISODEP = 0x02
+INTF_TAGCMD = 0x80
+
+# Device states
+ST_OFF = 'off'                # VEN low
+ST_RESET = 'reset'            # powered, waiting for CORE_RESET/CORE_INIT
+ST_IDLE = 'idle'
+ST_DISCOVERY = 'discovery'
+ST_W4_SELECT = 'w4_select'    # RF_DISCOVER_NTFs sent, waiting for the host
+ST_ACTIVE = 'active'
+ST_SLEEP = 'sleep'
+
+ENODEV = 19  # errno of a NAKed I2C address on the ESP32
+
+
+# =============================================================================
+# SCHEDULER
+# =============================================================================
+
+_pending = []
+_devices = []
+_running = False
+
+
+def schedule(func, arg):
+    """micropython.schedule(): queue func(arg) for the next pump()."""
+    if len(_pending) >= 8:
+        raise RuntimeError("schedule queue full")
+    _pending.append((func, arg))
+
+
+def pump():
+    """
+    Let the simulated hardware run: fire due device events and IRQ edges,
+    then run scheduled callbacks. Called whenever driver code touches a pin
+    or the bus, sleeps or waits on a ThreadSafeFlag.
+    """
+    global _running
+    for device in _devices:
+        device.poll()
+    if _running:
+        # like MicroPython, scheduled callbacks do not nest
+        return
+    _running = True
+    try:
+        while _pending:
+            func, arg = _pending.pop(0)
+            func(arg)
+    finally:
+        _running = False
+
+
+# =============================================================================
+# FAKE machine MODULE
+# =============================================================================
+
+class Pin:
+    """machine.Pin; inputs can be driven and outputs watched by a device."""
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    board = {}      # pin id -> most recently created Pin
+    drivers = {}    # pin id -> callable returning the input level
+    watchers = {}   # pin id -> callable(value) on output changes
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+        self._handler = None
+        self._trigger = 0
+        Pin.board[id] = self
+
+    def value(self, v=None):
+        if v is None:
+            pump()
+            driver = Pin.drivers.get(self.id)
+            return driver() if driver else self._value
+        self._value = 1 if v else 0
+        watcher = Pin.watchers.get(self.id)
+        if watcher:
+            watcher(self._value)
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_RISING | IRQ_FALLING, **kwargs):
+        self._handler = handler
+        self._trigger = trigger
+
+    def edge(self, rising):
+        """Run the IRQ handler if it is registered for this edge."""
+        if self._handler and self._trigger & (Pin.IRQ_RISING if rising else Pin.IRQ_FALLING):
+            self._handler(self)
+
+
+class I2C:
+    """machine.I2C on a bus shared by all attached devices."""
+    bus = {}  # address -> device
+
+    def __init__(self, id=0, *, scl=None, sda=None, freq=400000, timeout=50000):
+        self.freq = freq
+
+    def scan(self):
+        return sorted(a for a, d in I2C.bus.items() if d.powered)
+
+    def writeto(self, addr, buf, stop=True):
+        return self._device(addr).i2c_write(bytes(buf))
+
+    def readfrom(self, addr, nbytes, stop=True):
+        buf = bytearray(nbytes)
+        self.readfrom_into(addr, buf)
+        return bytes(buf)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self._device(addr).i2c_read(buf)
+
+    def _device(self, addr):
+        pump()
+        device = I2C.bus.get(addr)
+        if device is None or not device.powered:
+            raise OSError(ENODEV)
+        return device
+
+
+class UART:
+    """machine.UART; the other end feeds input with feed() and sees output in on_write."""
+    ports = {}  # UART id -> most recently created UART
+
+    def __init__(self, id, baudrate=9600, tx=None, rx=None, **kwargs):
+        self._rx = bytearray()
+        self.on_write = None
+        UART.ports[id] = self
+
+    def any(self):
+        pump()
+        return len(self._rx)
+
+    def read(self, nbytes=None):
+        pump()
+        if nbytes is None:
+            if not self._rx:
+                return None
+            nbytes = len(self._rx)
+        data = bytes(self._rx[:nbytes])
+        del self._rx[:nbytes]
+        return data
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self.on_write:
+            self.on_write(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def feed(self, data):
+        """Bytes arriving from the other end."""
+        self._rx += data
+
+
+# =============================================================================
+# MICROPYTHON EXTRAS FOR time AND asyncio
+# =============================================================================
+
+def _sleep_ms(ms):
+    deadline = time.monotonic() + ms / 1000
+    while True:
+        pump()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, POLL_S))
+
+
+class ThreadSafeFlag:
+    """asyncio.ThreadSafeFlag, polling the simulated hardware while waiting."""
+
+    def __init__(self):
+        self._set = False
+
+    def set(self):
+        self._set = True
+
+    def clear(self):
+        self._set = False
+
+    async def wait(self):
+        while not self._set:
+            pump()
+            if self._set:
+                break
+            await asyncio.sleep(POLL_S)
+        self._set = False
+
+
+class UARTStream:
+    """asyncio.StreamReader(uart) as on MicroPython, polling the fake UART."""
+
+    def __init__(self, uart):
+        self._uart = uart
+
+    async def read(self, n=-1):
+        while not self._uart.any():
+            await asyncio.sleep(POLL_S)
+        return self._uart.read(None if n < 0 else n)
+
+
+def _stream_reader(*args, **kwargs):
+    # CPython's StreamReader is still needed by asyncio.open_connection()
+    if args and isinstance(args[0], UART):
+        return UARTStream(args[0])
+    return _StreamReader(*args, **kwargs)
+
+
+_StreamReader = asyncio.StreamReader
+
+
+async def _async_sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+def _wait_for_ms(aw, ms):
+    return asyncio.wait_for(aw, ms / 1000)
+
+
+def install(device=None):
+    """
+    Install the fake modules and attach a device to the bus.
+
+    Must run before lib_PN7150 or doorman2_nfc are imported. Also puts
+    doorman2/esp32 on sys.path.
+
+    Args:
+        device (Device, optional): Device to attach, a default one if None
+
+    Returns:
+        Device: The attached device
+    """
+    machine = types.ModuleType('machine')
+    machine.Pin = Pin
+    machine.I2C = I2C
+    machine.UART = UART
+    sys.modules['machine'] = machine
+
+    micropython = types.ModuleType('micropython')
+    micropython.schedule = schedule
+    micropython.const = lambda x: x
+    micropython.alloc_emergency_exception_buf = lambda size: None
+    sys.modules['micropython'] = micropython
+
+    time.sleep_ms = _sleep_ms
+    time.sleep_us = lambda us: _sleep_ms(us / 1000)
+    time.ticks_ms = lambda: int(time.monotonic() * 1000)
+    time.ticks_us = lambda: int(time.monotonic() * 1000000)
+    time.ticks_add = lambda a, b: a + b
+    time.ticks_diff = lambda a, b: a - b
+
+    asyncio.ThreadSafeFlag = ThreadSafeFlag
+    asyncio.sleep_ms = _async_sleep_ms
+    asyncio.wait_for_ms = _wait_for_ms
+    asyncio.StreamReader = _stream_reader
+
+    if ESP32_DIR not in sys.path:
+        sys.path.insert(0, ESP32_DIR)
+
+    device = device or Device()
+    device.attach()
+    return device
+
+
+# =============================================================================
+# NCI DEVICE MODEL
+# =============================================================================
+
+def _now():
+    return time.monotonic()
+
+
+class Tag:
+    """
+    A scripted NFC-A tag.
+
+    Args:
+        uid (bytes): NFCID1, 4, 7 or 10 bytes
+        protocol (int): PROT_T2T, PROT_ISODEP or PROT_MIFARE
+        sak (int, optional): SEL_RES, derived from the protocol if None
+        ats (bytes): RATS response of an ISO-DEP tag
+        apdu (callable or dict): Command APDU -> response APDU (bytes),
+            for ISO-DEP tags; unknown commands get 6A 82
+        delay_ms (int): Time the tag takes to answer an APDU
+        random_uid (bool): Pick a new random 4-byte NFCID1 (08 xx xx xx)
+            on every activation, like a phone
+    """
+
+    def __init__(self, uid, protocol=PROT_T2T, sak=None, ats=b'\x05\x78\x80\x70\x02', apdu=None, delay_ms=0,
+                 random_uid=False):
+        self.uid = bytes(uid)
+        self.protocol = protocol
+        if sak is None:
+            sak = {PROT_ISODEP: 0x20, PROT_MIFARE: 0x08}.get(protocol, 0x00)
+        self.sak = sak
+        self.ats = bytes(ats) if protocol == PROT_ISODEP else b''
+        self.apdu = apdu
+        self.delay_ms = delay_ms
+        self.random_uid = random_uid
+
+    @property
+    def interface(self):
+        return {PROT_ISODEP: INTF_ISODEP, PROT_MIFARE: INTF_TAGCMD}.get(self.protocol, INTF_FRAME)
+
+    def tech_params(self):
+        """NFC-A poll mode technology specific parameters."""
+        size_bits = {4: 0x00, 7: 0x40, 10: 0x80}.get(len(self.uid), 0x00)
+        return bytes([size_bits | 0x04, 0x00, len(self.uid)]) + self.uid + bytes([1, self.sak])
+
+    def activation_ntf(self, disc_id=1):
+        """RF_INTF_ACTIVATED_NTF for this tag."""
+        params = self.tech_params()
+        act = bytes([len(self.ats)]) + self.ats if self.ats else b''
+        p = (bytes([disc_id, self.interface, self.protocol, 0x00, 0xFF, 0x01, len(params)]) + params +
+             bytes([0x00, 0x00, 0x00, len(act)]) + act)
+        return bytes([0x61, 0x05, len(p)]) + p
+
+    def discover_ntf(self, disc_id, last):
+        """RF_DISCOVER_NTF for this tag."""
+        params = self.tech_params()
+        p = bytes([disc_id, self.protocol, 0x00, len(params)]) + params + bytes([0x00 if last else 0x02])
+        return bytes([0x61, 0x03, len(p)]) + p
+
+    def answer(self, command):
+        if callable(self.apdu):
+            return self.apdu(command)
+        if self.apdu:
+            return self.apdu.get(bytes(command), b'\x6a\x82')
+        return b'\x6a\x82'
+
+
+class Device:
+    """
+    Model of a PN7150 on I2C address `addr` with IRQ and VEN pins.
+
+    Frames for the host are queued with the time they become readable;
+    the IRQ pin is HIGH while the oldest one is readable and gets a
+    rising edge for every frame, like the real chip.
+
+    Fault injection (probabilities are per command or read):
+        drop (float): Command is ACKed but never answered
+        corrupt (float): One bit of a read transaction is flipped
+        nak (float): Write is NAKed (OSError ENODEV)
+        wedge(kind): Stop answering until CORE_RESET ('nci') or a VEN
+            power cycle ('ven')
+        error_ntf(status): Send CORE_GENERIC_ERROR_NTF
+
+    Configuration set with CORE_SET_CONFIG survives resets, like the
+    PN7150's EEPROM-backed parameters.
+
+    Statistics: writes, reads, bytes_out, bytes_in, resets, activations.
+    `log` holds every command frame written by the host.
+    """
+
+    def __init__(self, addr=0x28, irq_pin=15, ven_pin=14, latency_ms=0, activation_ms=0, seed=None):
+        """
+        Args:
+            addr (int): I2C address
+            irq_pin (int): Pin id the IRQ output is wired to
+            ven_pin (int): Pin id driving VEN
+            latency_ms (float): Time from a command to its response
+            activation_ms (float): Time from a tag entering the field to
+                its activation
+            seed (int, optional): Seed for fault injection
+        """
+        self.addr = addr
+        self.irq_pin = irq_pin
+        self.ven_pin = ven_pin
+        self.latency_ms = latency_ms
+        self.activation_ms = activation_ms
+        self.random = random.Random(seed)
+        self.drop = 0.0
+        self.corrupt = 0.0
+        self.nak = 0.0
+        self.wedged = None
+
+        self.powered = True
+        self.state = ST_RESET
+        self.config = {}
+        self.field = []
+        self._once = []
+        self.active = None
+        self._candidates = []
+        self._out = []
+        self._pos = 0
+        self._timers = []
+        self._irq_level = 0
+
+        self.log = []
+        self.writes = 0
+        self.reads = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.resets = 0
+        self.activations = 0
+
+    def attach(self):
+        """Connect the device to the fake I2C bus and pins."""
+        I2C.bus[self.addr] = self
+        Pin.drivers[self.irq_pin] = self._irq_value
+        Pin.watchers[self.ven_pin] = self._ven
+        if self not in _devices:
+            _devices.append(self)
+
+    # -- scripting -----------------------------------------------------------
+
+    def place(self, tag):
+        """Put a tag in the field; it stays until remove()."""
+        self.field.append(tag)
+        self._discover()
+
+    def tap(self, tag):
+        """Put a tag in the field for exactly one activation."""
+        self._once.append(tag)
+        self.place(tag)
+
+    def remove(self, tag=None):
+        """Take a tag (all tags if None) out of the field."""
+        for t in list(self.field):
+            if tag is None or t is tag:
+                self.field.remove(t)
+        if self.active is not None and (tag is None or self.active is tag):
+            # RF link loss, back to discovery
+            self.active = None
+            self.state = ST_DISCOVERY
+            self.send(b'\x61\x06\x02\x03\x02')
+
+    def after(self, ms, func):
+        """Run func() once ms milliseconds from now."""
+        self._timers.append((_now() + ms / 1000, func))
+
+    def wedge(self, kind='nci'):
+        """Stop answering until CORE_RESET ('nci') or VEN power cycle ('ven')."""
+        self.wedged = kind
+
+    def error_ntf(self, status=0x03):
+        """Send CORE_GENERIC_ERROR_NTF."""
+        self.send(bytes([0x60, 0x07, 0x01, status]))
+
+    def send(self, frame, delay_ms=None):
+        """Queue a frame for the host, readable after delay_ms (latency_ms if None)."""
+        ready = _now() + (self.latency_ms if delay_ms is None else delay_ms) / 1000
+        if self._out:
+            ready = max(ready, self._out[-1][0])
+        self._out.append((ready, bytes(frame)))
+
+    # -- hardware ------------------------------------------------------------
+
+    def poll(self):
+        """Run due timers and raise the IRQ line for a readable frame."""
+        if self._timers:
+            now = _now()
+            due = [t for t in self._timers if t[0] <= now]
+            if due:
+                self._timers = [t for t in self._timers if t[0] > now]
+                for _, func in due:
+                    func()
+        level = self._irq_value()
+        if level and not self._irq_level:
+            self._irq_level = 1
+            pin = Pin.board.get(self.irq_pin)
+            if pin:
+                pin.edge(True)
+        elif not level:
+            self._irq_level = 0
+
+    def _irq_value(self):
+        return 1 if self._out and self._out[0][0] <= _now() else 0
+
+    def _ven(self, value):
+        if not value and self.powered:
+            self.powered = False
+            self.state = ST_OFF
+            self.active = None
+            self._out = []
+            self._pos = 0
+            self._irq_level = 0
+            if self.wedged == 'ven':
+                self.wedged = None
+        elif value and not self.powered:
+            self.powered = True
+            self.state = ST_RESET
+
+    def i2c_write(self, buf):
+        if self.nak and self.random.random() < self.nak:
+            raise OSError(ENODEV)
+        self.writes += 1
+        self.bytes_out += len(buf)
+        self.log.append(buf)
+        if self.wedged:
+            if self.wedged == 'nci' and buf[:2] == b'\x20\x00':
+                self.wedged = None
+            else:
+                return len(buf)
+        if self.drop and self.random.random() < self.drop:
+            return len(buf)
+        self._command(buf)
+        return len(buf)
+
+    def i2c_read(self, buf):
+        self.reads += 1
+        if not self._irq_value():
+            # nothing pending, the bus reads idle-high
+            buf[:] = b'\xff' * len(buf)
+            return
+        frame = self._out[0][1]
+        chunk = frame[self._pos:self._pos + len(buf)]
+        buf[:len(chunk)] = chunk
+        if len(chunk) < len(buf):
+            buf[len(chunk):] = b'\xff' * (len(buf) - len(chunk))
+        self.bytes_in += len(chunk)
+        if chunk and self.corrupt and self.random.random() < self.corrupt:
+            buf[self.random.randrange(len(chunk))] ^= 1 << self.random.randrange(8)
+        self._pos += len(buf)
+        if self._pos >= len(frame):
+            # frame consumed, IRQ drops until the next one is readable
+            self._out.pop(0)
+            self._pos = 0
+            self._irq_level = 0
+
+    # -- NCI -----------------------------------------------------------------
+
+    def _rsp(self, gid, oid, payload):
+        self.send(bytes([0x40 | gid, oid, len(payload)]) + payload)
+
+    def _command(self, buf):
+        mt, gid, oid = buf[0] & 0xE0, buf[0] & 0x0F, buf[1] & 0x3F
+        if len(buf) < 3 or buf[2] != len(buf) - 3:
+            # header length doesn't match the payload written
+            if mt == 0x00:
+                self.send(bytes([0x60, 0x08, 0x02, STATUS_SYNTAX_ERROR, buf[0] & 0x0F]))
+            else:
+                self._rsp(gid, oid, bytes([STATUS_SYNTAX_ERROR]))
+            return
+        if mt == 0x00:
+            self._data(buf)
+        elif gid == 0x00 and oid == 0x00:
+            # CORE_RESET
+            self.resets += 1
+            self.state = ST_RESET
+            self.active = None
+            self._rsp(0, 0, b'\x00\x10\x01')
+        elif gid == 0x00 and oid == 0x01:
+            # CORE_INIT: features, 4 RF interfaces, limits, manufacturer info
+            self.state = ST_IDLE
+            self._rsp(0, 1, bytes([0, 0, 0, 0, 0, 4, 1, 2, 3, 0x80, 1, 0, 0, 0xFF, 0, 0,
+                                   0x04, 0x00, 0x10, 0x08, 0x01]))
+        elif self.state in (ST_RESET, ST_OFF):
+            self._rsp(gid, oid, bytes([STATUS_NOT_INITIALIZED]))
+        elif gid == 0x00 and oid == 0x02:
+            self._set_config(buf)
+        elif gid == 0x00 and oid == 0x03:
+            self._get_config(buf)
+        elif gid == 0x0F:
+            # proprietary; PROP_ACT reports a firmware version
+            self._rsp(gid, oid, b'\x00\x00\x00\x00\x00' if oid == 0x02 else b'\x00')
+        elif gid == 0x01 and oid == 0x03:
+            # RF_DISCOVER
+            if self.state != ST_IDLE:
+                self._rsp(1, 3, bytes([STATUS_SEMANTIC_ERROR]))
+                return
+            self._rsp(1, 3, b'\x00')
+            self.state = ST_DISCOVERY
+            self._discover()
+        elif gid == 0x01 and oid == 0x04:
+            self._select(buf)
+        elif gid == 0x01 and oid == 0x06:
+            self._deactivate(buf[3])
+        elif gid == 0x01 and oid in (0x00, 0x01):
+            # RF_DISCOVER_MAP, RF_SET_LISTEN_MODE_ROUTING
+            self._rsp(1, oid, b'\x00')
+        else:
+            self._rsp(gid, oid, bytes([STATUS_REJECTED]))
+
+    def _set_config(self, buf):
+        i = 4
+        items = {}
+        invalid = []
+        for _ in range(buf[3]):
+            id_len = 2 if buf[i] == 0xA0 else 1
+            param = bytes(buf[i:i + id_len])
+            size = buf[i + id_len]
+            if i + id_len + 1 + size > len(buf):
+                self._rsp(0, 2, bytes([STATUS_SYNTAX_ERROR, 0]))
+                return
+            if CONFIG_SIZES.get(param, size) != size:
+                invalid.append(param)
+            items[param] = bytes(buf[i + id_len + 1:i + id_len + 1 + size])
+            i += id_len + 1 + size
+        if invalid:
+            # nothing is applied, the invalid parameters are listed
+            self._rsp(0, 2, bytes([STATUS_INVALID_PARAM, len(invalid)]) + b''.join(invalid))
+            return
+        self.config.update(items)
+        self._rsp(0, 2, b'\x00\x00')
+
+    def _get_config(self, buf):
+        i = 4
+        items = []
+        for _ in range(buf[3]):
+            id_len = 2 if buf[i] == 0xA0 else 1
+            param = bytes(buf[i:i + id_len])
+            i += id_len
+            value = self.config.get(param)
+            if value is not None:
+                items.append(param + bytes([len(value)]) + value)
+        self._rsp(0, 3, bytes([0, len(items)]) + b''.join(items))
+
+    def _discover(self):
+        if self.state != ST_DISCOVERY or not self.field:
+            return
+        if len(self.field) == 1:
+            tag = self.field[0]
+            self.after(self.activation_ms, lambda: self._activate(tag, 1))
+            return
+        # several tags: let the host pick one
+        self.state = ST_W4_SELECT
+        self._candidates = list(self.field)
+        for n, tag in enumerate(self._candidates):
+            self.send(tag.discover_ntf(n + 1, n == len(self._candidates) - 1))
+
+    def _select(self, buf):
+        n = buf[3] - 1
+        if self.state != ST_W4_SELECT or not 0 <= n < len(self._candidates):
+            self._rsp(1, 4, bytes([STATUS_SEMANTIC_ERROR]))
+            return
+        self._rsp(1, 4, b'\x00')
+        tag = self._candidates[n]
+        self.state = ST_DISCOVERY
+        self.after(self.activation_ms, lambda: self._activate(tag, n + 1))
+
+    def _activate(self, tag, disc_id):
+        if self.state != ST_DISCOVERY or tag not in self.field:
+            return
+        self.state = ST_ACTIVE
+        self.active = tag
+        self.activations += 1
+        if tag.random_uid:
+            tag.uid = b'\x08' + os.urandom(3)
+        if tag in self._once:
+            self._once.remove(tag)
+            self.field.remove(tag)
+        self.send(tag.activation_ntf(disc_id))
+
+    def _deactivate(self, kind):
+        self._rsp(1, 6, b'\x00')
+        if self.state in (ST_ACTIVE, ST_SLEEP):
+            self.send(bytes([0x61, 0x06, 0x02, kind, 0x00]))
+        self.active = None
+        if kind == 0x00:
+            self.state = ST_IDLE
+        elif kind == 0x03:
+            self.state = ST_DISCOVERY
+            self._discover()
+        else:
+            self.state = ST_SLEEP
+
+    def _data(self, buf):
+        tag = self.active
+        if tag is None or tag.protocol != PROT_ISODEP:
+            # CORE_INTERFACE_ERROR_NTF on the static connection
+            self.send(bytes([0x60, 0x08, 0x02, STATUS_SEMANTIC_ERROR, 0x00]))
+            return
+        # CORE_CONN_CREDITS_NTF, then the tag's answer
+        self.send(b'\x60\x06\x03\x01\x00\x01')
+        response = bytes(tag.answer(bytes(buf[3:3 + buf[2]])))[:255]
+        self.send(bytes([0x00, 0x00, len(response)]) + response, self.latency_ms + tag.delay_ms)
+
+
+# =============================================================================
+# COMMAND LINE
+# =============================================================================
+
+HCE_AID = b'\xf1\x72\x65\x76\x40\x68\x73'
+
+
+def hce_phone(token):
+    """ISO-DEP tag answering the Mermaid Sesame SELECT AID with token."""
+    select = bytes([0x00, 0xA4, 0x04, 0x00, len(HCE_AID)]) + HCE_AID
+    return Tag(b'\x08' + os.urandom(3), PROT_ISODEP, apdu={select: token + b'\x90\x00'}, random_uid=True)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0
+
+
+def report(device, latencies, missed, n):
+    print(f"tags: {n - missed}/{n} read")
+    if latencies:
+        print(f"tap to UID ms: p50 {percentile(latencies, 50):.2f}  p99 {percentile(latencies, 99):.2f}"
+              f"  max {max(latencies):.2f}")
+    print(f"I2C per tag: {device.writes / n:.1f} writes, {device.reads / n:.1f} reads,"
+          f" {(device.bytes_out + device.bytes_in) / n:.0f} bytes")
+    print(f"device: {device.activations} activations, {device.resets} CORE_RESETs")
+
+
+async def run_nfc(device, args):
+    import doorman2_nfc
+    nfc = doorman2_nfc.Nfc()
+    loop = asyncio.create_task(nfc.loop())
+    while device.state != ST_DISCOVERY:
+        await asyncio.sleep(0.01)
+    device.writes = device.reads = device.bytes_out = device.bytes_in = device.resets = 0
+
+    latencies = []
+    missed = 0
+    for i in range(args.n):
+        if args.wedge_every and i and i % args.wedge_every == 0:
+            device.wedge('ven' if i // args.wedge_every % 2 else 'nci')
+        uid = bytes([0x04, i >> 8 & 0xFF, i & 0xFF, 0x5A])
+        tag = hce_phone(uid) if args.hce and i % 2 else Tag(uid)
+        waiter = asyncio.create_task(nfc.wait_uid())
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        # the tag stays in the field for the whole tap and is read more than once
+        device.place(tag)
+        try:
+            got = await asyncio.wait_for(waiter, args.timeout)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if bytes(got) != uid:
+                print(f"tag {i}: got {bytes(got).hex()}, expected {uid.hex()}")
+        except asyncio.TimeoutError:
+            missed += 1
+        await asyncio.sleep(max(0, start + args.tap_ms / 1000 - time.perf_counter()))
+        device.remove(tag)
+        await asyncio.sleep(0.002)
+
+    loop.cancel()
+    report(device, latencies, missed, args.n)
+    from doorman2_metrics import metrics
+    resets = [metrics.counter('nfc.resets.' + level).value for level in ('nci', 'ven', 'full')]
+    print(f"watchdog: {metrics.counter('nfc.faults').value} faults, resets (nci, ven, full) {resets},"
+          f" max recovery {metrics.histogram('nfc.recovery_us').max // 1000} ms")
+
+
+async def run_held(device, args):
+    import doorman2_nfc
+    nfc = doorman2_nfc.Nfc()
+    loop = asyncio.create_task(nfc.loop())
+    while device.state != ST_DISCOVERY:
+        await asyncio.sleep(0.01)
+
+    for tag in (hce_phone(b'\xc0\x01\x02\x11\x22\x33'), Tag(b'\x04\x01\x02\x03')):
+        device.writes = device.reads = device.bytes_out = device.bytes_in = device.activations = 0
+        # nothing calls wait_uid(), so every UID the loop reports stays queued
+        nfc._uids.clear()
+        device.place(tag)
+        await asyncio.sleep(args.held)
+        device.remove(tag)
+        await asyncio.sleep(0.01)
+        kind = 'phone' if tag.protocol == PROT_ISODEP else 'card'
+        print(f"{kind} held {args.held:g} s: {device.activations} activations, {device.writes} I2C writes,"
+              f" {device.reads} reads, {len(nfc._uids)} UIDs queued")
+    loop.cancel()
+
+
+def run_scanner(device, args):
+    path = os.path.abspath(args.scanner)
+    # like the board's filesystem: files next to the scanner are importable
+    os.chdir(os.path.dirname(path))
+    sys.path.insert(0, os.path.dirname(path))
+    state = {'n': 0}
+
+    def next_tag():
+        if state['n'] == args.n:
+            raise KeyboardInterrupt
+        state['n'] += 1
+        device.tap(Tag(bytes([0x04, state['n'], 0x22, 0x33, 0x44, 0x55, 0x66])))
+        device.after(2000, next_tag)
+
+    device.after(100, next_tag)
+    with open(path) as f:
+        code = compile(f.read(), path, 'exec')
+    exec(code, {'__name__': '__main__', '__file__': path})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', type=int, default=50, help='tags to tap')
+    parser.add_argument('--latency-ms', type=float, default=0.5, help='command to response time')
+    parser.add_argument('--activation-ms', type=float, default=0, help='tag in field to activation time')
+    parser.add_argument('--hce', action='store_true', help='alternate cards with HCE phones')
+    parser.add_argument('--drop', type=float, default=0, help='probability a command goes unanswered')
+    parser.add_argument('--corrupt', type=float, default=0, help='probability a read is corrupted')
+    parser.add_argument('--nak', type=float, default=0, help='probability a write is NAKed')
+    parser.add_argument('--wedge-every', type=int, default=0, help='wedge the controller every N tags')
+    parser.add_argument('--timeout', type=float, default=20, help='seconds before a tag counts as missed')
+    parser.add_argument('--seed', type=int, default=None, help='fault injection seed')
+    parser.add_argument('--tap-ms', type=float, default=150, help='time each tapped tag stays in the field')
+    parser.add_argument('--held', type=float, help='leave a phone, then a card, in the field this many seconds')
+    parser.add_argument('--scanner', help='run this TESTED scanner script instead of doorman2_nfc')
+    args = parser.parse_args()
+
+    device = install(Device(latency_ms=args.latency_ms, activation_ms=args.activation_ms, seed=args.seed))
+    if args.scanner:
+        run_scanner(device, args)
+        report(device, [], 0, max(args.n, 1))
+    else:
+        device.drop = args.drop
+        device.corrupt = args.corrupt
+        device.nak = args.nak
+        asyncio.run(run_held(device, args) if args.held else run_nfc(device, args))